@@ -1,8 +1,21 @@
 from stock_analysis.utils import parse_start_end_date, get_stats_intervals
 from stock_analysis.utils import get_symbol_yahoo_stats
-from stock_analysis.utils import moving_average, find_trend
+from stock_analysis.utils import moving_average, find_trend, find_trends, rolling_trend
+from stock_analysis.utils import linear_filter, relative_strength_index
+from stock_analysis.utils import rolling_max, rolling_min, stochastic_oscillator
+from stock_analysis.utils import momentum, rate_of_change
+from stock_analysis.utils import str2nums
+
+from stock_analysis.store import load_quotes, save_quotes, migrate_csv_quotes, merge_quotes
 
 from stock_analysis.symbol import Symbol
+from stock_analysis.universe import QuoteMatrix
+from stock_analysis.executor import ComponentExecutor
+from stock_analysis.downloader import QuoteDownloader
+from stock_analysis.scoring import Scorer
+from stock_analysis.instrument import Instrumentation
+from stock_analysis.fundamentals import FundamentalsFetcher, get_fundamentals
+from stock_analysis.financials import parse_financials_html
 
 from stock_analysis.index import Index, SP500, SP400, DJIA, NASDAQ, NASDAQ100
 from stock_analysis.index import get_index_components_from_wiki, ranking
@@ -0,0 +1,84 @@
+"""
+Import time of the stock_analysis package.
+
+Every run imports the package in a fresh interpreter, once as it is (the remote data, scraping
+and plotting modules are lazy, see lazy.py) and once with those modules imported first, like
+the package did before. Modules that are not installed are skipped.
+
+Usage:
+    python benchmarks/import_time.py [-n RUNS] [--json FILE]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+# the modules the package used to import at import time
+HEAVY_MODULES = ['pandas_datareader.data', 'pandas_datareader._utils', 'bs4', 'yahoo_finance',
+                 'matplotlib.pyplot', 'selenium.webdriver']
+
+LAZY = """
+import time
+t = time.perf_counter()
+import stock_analysis
+print(time.perf_counter() - t)
+"""
+
+EAGER = """
+import time, importlib
+t = time.perf_counter()
+for m in %r:
+    try:
+        importlib.import_module(m)
+    except ImportError:
+        pass
+import stock_analysis
+print(time.perf_counter() - t)
+""" %HEAVY_MODULES
+
+def package_parent():
+    # the directory containing the stock_analysis package, i.e. the parent of this checkout
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def time_import(code, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = package_parent() + os.pathsep + env.get('PYTHONPATH', '')
+    times = list()
+    for i in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if out.returncode != 0:
+            print('Error: failed to import stock_analysis:\n' + out.stderr)
+            sys.exit(1)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+def installed(modules):
+    code = 'import json, importlib.util as u; print(json.dumps([m for m in %r if u.find_spec(m.split(".")[0]) != None]))' %modules
+    out = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True)
+    return json.loads(out.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time of the stock_analysis package.')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='number of runs of each mode')
+    parser.add_argument('--json', help='save the results to a JSON file')
+    args = parser.parse_args()
+
+    results = {'runs': args.runs, 'python': sys.version.split()[0], 'heavy_modules': installed(HEAVY_MODULES)}
+    for mode, code in [('lazy', LAZY), ('eager', EAGER)]:
+        times = time_import(code, args.runs)
+        results[mode] = {'median': float(np.median(times)), 'min': float(np.min(times)), 'max': float(np.max(times))}
+    results['speedup'] = results['eager']['median'] / results['lazy']['median']
+
+    print('Heavy modules installed: %s' %(', '.join(results['heavy_modules']) or 'none'))
+    print('%-6s %10s %10s %10s' %('mode', 'median(s)', 'min(s)', 'max(s)'))
+    for mode in ['lazy', 'eager']:
+        print('%-6s %10.3f %10.3f %10.3f' %(mode, results[mode]['median'], results[mode]['min'], results[mode]['max']))
+    print('Speedup: %.2fx' %results['speedup'])
+    if args.json != None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Offline data sources for the benchmarks.
+
+offline() patches every network access of the package with synthetic data, see synthetic.py:
+    - quotes of Symbol.get_quotes()/update_quotes() (pandas_datareader)
+    - quotes of the index components (QuoteDownloader)
+    - fundamentals (FundamentalsFetcher)
+The patches are undone on exit. SyntheticIndex is an Index of synthetic components.
+"""
+import os
+import contextlib
+import pandas as pd
+from pandas import DataFrame
+
+from stock_analysis import utils
+from stock_analysis.index import Index
+from stock_analysis.downloader import QuoteDownloader
+from stock_analysis.fundamentals import FundamentalsFetcher
+
+from synthetic import synthetic_components, synthetic_fundamentals, synthetic_financials
+
+_MISSING = object()
+
+@contextlib.contextmanager
+def patched(obj, name, value):
+    """
+    Set obj.name to value within the context.
+    """
+    old = obj.__dict__.get(name, _MISSING)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        if old is _MISSING:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, old)
+
+@contextlib.contextmanager
+def offline(quotes):
+    """
+    Serve quotes, a dict of <symbol:DataFrame>, instead of downloading them, and synthetic
+    fundamentals.
+    """
+    def data_reader(sym, source, start, end):
+        return quotes[sym][pd.Timestamp(start):pd.Timestamp(end)]
+
+    def download(self, symbols, start_date, end_date):
+        starts = start_date if type(start_date) == dict else {sym: start_date for sym in symbols}
+        return {sym: quotes[sym][pd.Timestamp(starts[sym]):pd.Timestamp(end_date)] for sym in symbols if sym in quotes}
+
+    def fetch_batch(self, symbols, fields):
+        return {sym: synthetic_fundamentals(sym, fields) for sym in symbols}
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patched(utils.web, 'DataReader', data_reader)) # a LazyModule, not imported
+        stack.enter_context(patched(QuoteDownloader, 'download', download))
+        stack.enter_context(patched(FundamentalsFetcher, '_fetch_batch', fetch_batch))
+        yield
+
+def write_financials(datapath, symbols):
+    """
+    Save synthetic statements of symbols under datapath, where Symbol.load_financial_data() reads them.
+    """
+    for sym in symbols:
+        path = os.path.join(datapath, sym)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name, statement in synthetic_financials(sym).items():
+            statement.to_csv(os.path.join(path, name + '.csv'))
+
+class SyntheticIndex(Index):
+    """
+    Index of the synthetic components S00000, S00001, ... and the index quotes '^SYN'.
+    """
+    def __init__(self, n, datapath, index_quotes=None):
+        super(SyntheticIndex, self).__init__(sym='^SYN', name='Synthetic', datapath=datapath)
+        self.n = n
+        if index_quotes is not None:
+            self.sym.quotes = index_quotes
+
+    def get_compo_list(self):
+        self.components = synthetic_components(self.n)
+        return self.components
@@ -0,0 +1,220 @@
+"""
+Benchmarks of the stock_analysis package on synthetic data, without network access.
+
+Every benchmark runs over a grid of parameters, e.g. the history length (days) or the universe
+size (symbols). The results can be saved as JSON and compared with the results of another
+commit.
+
+Usage:
+    python benchmarks/run.py                        # all benchmarks
+    python benchmarks/run.py -k ranking -k filter   # benchmarks with these names
+    python benchmarks/run.py --quick                # the smallest parameters only
+    python benchmarks/run.py --json new.json --compare old.json
+The exit status is 1 if any benchmark failed, the failures are also in the JSON results.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import warnings
+import contextlib
+import io
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+# the directory containing the stock_analysis package, i.e. the parent of this checkout, and this one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stock_analysis.utils import moving_average
+from stock_analysis.symbol import Symbol, Benchmark
+from stock_analysis.index import ranking
+
+from synthetic import synthetic_quotes, synthetic_universe, synthetic_stats
+from offline import offline, write_financials, SyntheticIndex
+
+BENCHMARKS = [] # [name, function, grid]
+
+def benchmark(**grid):
+    """
+    Register a benchmark run for every combination of the parameters in grid, e.g.
+        @benchmark(days=[1000, 5000])
+        def bench_xxx(days):
+            ...setup...
+            return lambda: ...timed...
+    The function does the setup and returns the function to be timed. That function may have
+    the attributes setup, called before every timed run but not timed, and cleanup, called
+    after the last run.
+    """
+    def register(func):
+        BENCHMARKS.append([func.__name__.replace('bench_', ''), func, grid])
+        return func
+    return register
+
+def new_symbol(quotes):
+    stock = Symbol('S00000', loaddata=False)
+    stock.quotes = quotes # also clears the indicator cache
+    return stock
+
+@benchmark(days=[1000, 5000])
+def bench_moving_average(days):
+    close = synthetic_quotes(days)['Adj Close']
+    return lambda: [moving_average(close, n, type=t) for n in [10, 50, 200] for t in ['simple', 'exponential']]
+
+@benchmark(days=[1000, 5000])
+def bench_symbol_indicators(days):
+    quotes = synthetic_quotes(days)
+    def run():
+        stock = new_symbol(quotes)
+        stock.rsi()
+        stock.stochastic()
+        stock.macd()
+        stock.roc()
+    return run
+
+@benchmark(days=[1000, 5000])
+def bench_return_stats(days):
+    quotes = synthetic_quotes(days)
+    return lambda: new_symbol(quotes).return_stats()
+
+@benchmark(days=[1000, 5000])
+def bench_diverge_stats(days):
+    quotes = synthetic_quotes(days)
+    index = Symbol('^SYN', loaddata=False)
+    index.quotes = synthetic_quotes(days + 300, seed=99999)
+    benchmark = Benchmark(index)
+    return lambda: new_symbol(quotes).diverge_stats(benchmark)
+
+@benchmark(symbols=[500, 10000])
+def bench_filter(symbols):
+    index = SyntheticIndex(symbols, tempfile.gettempdir())
+    index.components = synthetic_stats(symbols)
+    columns = {'AvgQuarterlyReturn': False, 'MedianQuarterlyReturn': False, 'PriceIn52weekRange': True, 'FSTO': True}
+    return lambda: index.filter(columns, n=symbols // 4)
+
+@benchmark(symbols=[500, 10000])
+def bench_sector_top(symbols):
+    index = SyntheticIndex(symbols, tempfile.gettempdir())
+    index.components = synthetic_stats(symbols)
+    return lambda: index.sector_top(0.5)
+
+@benchmark(symbols=[500, 10000])
+def bench_ranking(symbols):
+    stats = synthetic_stats(symbols)
+    return lambda: ranking(stats)
+
+@benchmark(symbols=[20, 100], days=[1000], matrix=[False, True], store=['cold', 'warm'])
+def bench_index_get_stats(symbols, days, matrix, store):
+    # cold: every run starts from an empty datapath, so all quotes and fundamentals are downloaded
+    # warm: the quote stores and the fundamentals cache of an untimed first run are reused
+    quotes = synthetic_universe(symbols, days)
+    index_quotes = synthetic_quotes(days + 300, seed=99999)
+    datapaths = list()
+    state = dict()
+    def setup():
+        if store == 'warm' and 'index' in state:
+            return
+        datapath = tempfile.mkdtemp(prefix='stock_analysis_bench_')
+        datapaths.append(datapath)
+        write_financials(datapath, quotes.keys())
+        state['index'] = SyntheticIndex(symbols, datapath, index_quotes)
+        if store == 'warm':
+            run()
+    def run():
+        with offline(quotes):
+            state['index'].get_stats(save=False, matrix=matrix, workers=1)
+    def cleanup():
+        for datapath in datapaths:
+            shutil.rmtree(datapath, ignore_errors=True)
+    run.setup = setup
+    run.cleanup = cleanup
+    return run
+
+def run_benchmark(func, params, repeat):
+    """
+    Return the timings, or the error if the benchmark failed.
+    """
+    timed = None
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore')
+        try:
+            timed = func(**params)
+            times = list()
+            for i in range(repeat):
+                if hasattr(timed, 'setup'):
+                    timed.setup()
+                t = time.perf_counter()
+                timed()
+                times.append(time.perf_counter() - t)
+        except Exception as e:
+            return {'error': '%s: %s' %(type(e).__name__, e)}
+        finally:
+            if hasattr(timed, 'cleanup'):
+                timed.cleanup()
+    return {'min': min(times), 'median': float(np.median(times)), 'mean': float(np.mean(times)), 'repeat': repeat}
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def result_key(result):
+    return result['name'] + str(sorted(result['params'].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of stock_analysis on synthetic data.')
+    parser.add_argument('-k', dest='names', action='append', help='run the benchmarks matching this regex only')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timed runs of each benchmark')
+    parser.add_argument('--quick', action='store_true', help='run the smallest parameters only')
+    parser.add_argument('--json', help='save the results to a JSON file')
+    parser.add_argument('--compare', help='compare with the results in a JSON file')
+    args = parser.parse_args()
+
+    baseline = dict()
+    if args.compare != None:
+        with open(args.compare) as f:
+            baseline = {result_key(r): r for r in json.load(f)['results']}
+
+    results = list()
+    print('%-22s %-40s %10s %10s %8s' %('benchmark', 'params', 'min(s)', 'median(s)', 'change'))
+    for [name, func, grid] in BENCHMARKS:
+        if args.names != None and not any(re.search(k, name) for k in args.names):
+            continue
+        keys = list(grid.keys())
+        values = [[min(grid[k])] if args.quick and all(type(v) in [int, float] for v in grid[k]) else grid[k] for k in keys]
+        for combo in itertools.product(*values):
+            params = dict(zip(keys, combo))
+            result = {'name': name, 'params': params}
+            result.update(run_benchmark(func, params, args.repeat))
+            results.append(result)
+            if 'error' in result:
+                print('%-22s %-40s Error: %s' %(name, ', '.join('%s=%s' %p for p in params.items()), result['error']))
+                continue
+            old = baseline.get(result_key(result))
+            change = '%+.1f%%' %((result['median'] / old['median'] - 1) * 100) if old != None and 'median' in old else ''
+            print('%-22s %-40s %10.4f %10.4f %8s' %(name, ', '.join('%s=%s' %p for p in params.items()), result['min'], result['median'], change))
+
+    if args.json != None:
+        report = {'commit': git_commit(), 'date': dt.datetime.now().isoformat(timespec='seconds'),
+                  'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                  'machine': platform.machine(), 'cpus': os.cpu_count(), 'results': results}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    failed = [r for r in results if 'error' in r]
+    if len(failed) > 0:
+        print('Error: %d benchmarks failed.' %len(failed))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Deterministic synthetic market data for the benchmarks.
+
+Prices are geometric Brownian motions. 'Adj Close' is the total return series, 'Close' is
+raised by the dividends paid later and multiplied by the splits after each date, like the
+quotes from Yahoo Finance. Some symbols are listed late or have missing days, so the universe
+has ragged and gapped histories like a real one. The same seed always gives the same data.
+"""
+import datetime as dt
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+SECTORS = ['Consumer Discretionary', 'Consumer Staples', 'Energy', 'Financials', 'Health Care', 'Industrials',
+           'Information Technology', 'Materials', 'Real Estate', 'Telecommunication Services', 'Utilities']
+
+# numeric columns of synthetic component stats, in the style of Index.components
+STATS_COLUMNS = ['MarketCap', 'P/E', 'PEG', 'DividendYield', 'LastQuarterReturn', 'HalfYearReturn', '1YearReturn',
+                 '2YearReturn', '3YearReturn', 'AvgQuarterlyReturn', 'MedianQuarterlyReturn', 'AvgYearlyReturn',
+                 'MedianYearlyReturn', 'PriceIn52weekRange', 'HalfYearDivergeIndex', '1YearDivergeIndex',
+                 'YearlyDivergeIndex', 'ROC', 'RSI', 'MACD Diff', 'FSTO', 'SSTO', 'RevenueMomentum', 'ProfitMargin',
+                 'ProfitMarginMomentum', 'Debt/Assets', 'EPSGrowth', 'Forward P/E']
+
+def synthetic_quotes(days=1000, seed=0, end=None, price=50.0, mu=0.08, sigma=0.3, dividend=0.02, splits=1, gaps=0.0, listed=1.0):
+    """
+    History quotes of one symbol, a DataFrame indexed by 'Date' with the columns of DataReader.
+
+    days: number of business days up to end (default today)
+    mu, sigma: annual drift and volatility of the price
+    dividend: annual dividend yield, the gap between 'Close' and 'Adj Close'
+    splits: number of 2:1 or 3:1 splits
+    gaps: fraction of missing days
+    listed: fraction of the days the symbol is listed, the first days are dropped
+    """
+    rng = np.random.default_rng(seed)
+    if end == None:
+        end = dt.date.today()
+    dates = pd.bdate_range(end=end, periods=days, name='Date')
+    returns = (mu - sigma**2 / 2) / 252 + sigma / np.sqrt(252) * rng.standard_normal(days)
+    adj_close = price * np.exp(np.cumsum(returns))
+
+    # dividends paid after each date, then splits after each date
+    close = adj_close * np.exp(dividend / 252 * np.arange(days)[::-1])
+    factor = np.ones(days)
+    for i in np.sort(rng.choice(np.arange(1, days), size=min(splits, days - 1), replace=False)):
+        factor[:i] *= rng.choice([2.0, 3.0])
+    close *= factor
+
+    open_ = np.concatenate([[close[0]], close[:-1]]) * np.exp(0.003 * rng.standard_normal(days))
+    high = np.maximum(open_, close) * (1 + np.abs(0.01 * rng.standard_normal(days)))
+    low = np.minimum(open_, close) * (1 - np.abs(0.01 * rng.standard_normal(days)))
+    volume = np.round(rng.lognormal(13, 0.5, days) * factor)
+    quotes = DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume, 'Adj Close': adj_close}, index=dates)
+
+    quotes = quotes.iloc[days - int(np.ceil(days * listed)):]
+    if gaps > 0:
+        quotes = quotes[rng.random(len(quotes)) >= gaps]
+    return quotes
+
+def symbols(n):
+    return ['S%05d' %i for i in range(n)]
+
+def synthetic_universe(n, days=1000, seed=0, end=None):
+    """
+    History quotes of n symbols, a dict of <symbol:DataFrame>. About 10% of the symbols are
+    listed late and 10% have missing days.
+    """
+    rng = np.random.default_rng(seed)
+    quotes = dict()
+    for i, sym in enumerate(symbols(n)):
+        kind = rng.random()
+        quotes[sym] = synthetic_quotes(days, seed=seed * 1000003 + i + 1, end=end, price=rng.uniform(5, 200),
+                                       mu=rng.normal(0.08, 0.1), sigma=rng.uniform(0.15, 0.6), dividend=rng.uniform(0, 0.04),
+                                       splits=rng.integers(0, 3), gaps=0.02 if kind < 0.1 else 0.0,
+                                       listed=rng.uniform(0.2, 0.9) if 0.1 <= kind < 0.2 else 1.0)
+    return quotes
+
+def synthetic_components(n, seed=0):
+    """
+    Components list of an index with n symbols, indexed by 'Symbol' like Index.get_compo_list().
+    """
+    rng = np.random.default_rng(seed)
+    sectors = rng.choice(SECTORS, n)
+    industries = ['%s %d' %(s, rng.integers(4)) for s in sectors]
+    return DataFrame({'Symbol': symbols(n), 'Name': ['Company %d' %i for i in range(n)], 'Sector': sectors, 'Industry': industries}).set_index('Symbol')
+
+def synthetic_stats(n, seed=0, nan=0.05):
+    """
+    Component stats of an index with n symbols, like Index.components after get_stats().
+    nan: fraction of missing values
+    """
+    rng = np.random.default_rng(seed)
+    stats = synthetic_components(n, seed)
+    values = rng.standard_normal((n, len(STATS_COLUMNS)))
+    values[rng.random(values.shape) < nan] = np.nan
+    return stats.join(DataFrame(values, index=stats.index, columns=STATS_COLUMNS))
+
+def synthetic_fundamentals(sym, fields):
+    """
+    Fundamentals of a symbol, like FundamentalsFetcher downloads them.
+    """
+    rng = np.random.default_rng(sum(map(ord, sym)))
+    values = dict()
+    for f in fields:
+        if f == 'Name':
+            values[f] = 'Company ' + sym
+        elif f == 'Exchange':
+            values[f] = rng.choice(['NMS', 'NYQ'])
+        elif f in ['DividendPayDate', 'ExDividendDate']:
+            values[f] = '%d/%d/2017' %(rng.integers(1, 13), rng.integers(1, 29))
+        else:
+            values[f] = float(np.round(rng.lognormal(0, 1), 2))
+    return values
+
+# entries of the quarterly statements used by Symbol.financial_stats()
+STATEMENT_ENTRIES = {'income': ['Revenue', 'Total Revenue', 'Net Income', 'Operating Income'],
+                     'balance': ['Total Assets', 'Total Debt', 'Total Liabilities', "Total Liabilities & Shareholders' Equity"],
+                     'cashflow': ['Net Change in Cash', 'Cash from Operating Activities', 'Cash from Investing Activities', 'Cash from Financing Activities']}
+
+def synthetic_financials(sym, quarters=5):
+    """
+    Quarterly statements of a symbol as strings, like the saved income/balance/cashflow CSVs.
+    Return: dict of <statement:DataFrame indexed by 'Entries'>.
+    """
+    rng = np.random.default_rng(sum(map(ord, sym)) + 7)
+    dates = [(pd.Timestamp('2016-10-31') - pd.DateOffset(months=3 * i)).strftime('%Y-%m-%d') for i in range(quarters)]
+    statements = dict()
+    for name, entries in STATEMENT_ENTRIES.items():
+        rows = list()
+        for entry in entries:
+            values = rng.normal(1000, 300, quarters) * (1 if rng.random() < 0.8 else -1)
+            row = ['{:,.2f}'.format(v) for v in values]
+            if rng.random() < 0.05:
+                row[rng.integers(quarters)] = '-'
+            rows.append([entry] + row)
+        statements[name] = DataFrame(rows, columns=['Entries'] + dates).set_index('Entries')
+    return statements
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+from stock_analysis import instrument
+
+class IndicatorCache(object):
+    """
+    Bounded LRU cache of indicator results, e.g. the EMA series of a Symbol.
+
+    The cache is bound to a fingerprint of the data it was computed from. When validate() sees
+    a different fingerprint (quotes replaced or appended), all entries are dropped.
+    It is thread-safe, so one cache can be shared by the threads processing index components.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = None
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # locks can't be pickled, e.g. when a Symbol is sent to a worker process
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def validate(self, fingerprint):
+        """
+        Drop all entries if the data fingerprint changed.
+        """
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def get(self, key, calc):
+        """
+        Return the cached value of key, or calc() it and cache the result.
+
+        key: hashable, e.g. ('ema', 10, start_date, end_date)
+        calc: function without arguments
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                instrument.count('indicator_cache_hits')
+                return self._entries[key]
+            self.misses += 1
+            instrument.count('indicator_cache_misses')
+        value = calc() # don't hold the lock while computing
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False) # least recently used
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.fingerprint = None
+
+    def info(self):
+        """
+        Return a dict of cache statistics.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
@@ -0,0 +1,224 @@
+import io
+import ssl
+import time
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlencode, quote
+import pandas as pd
+from pandas import DataFrame
+from stock_analysis import instrument
+
+#
+# Bulk quote downloader on asyncio.
+#
+# HTTP/1.1 requests are sent over keep-alive connections kept in a pool per host, with a limit
+# on the requests in flight. Failed requests (connection errors, timeouts, 429 and 5xx) are
+# retried with exponential backoff. Only the standard library is used for the transport, so
+# base_url can point to a local stub server serving canned CSV.
+#
+YAHOO_DOWNLOAD_URL = 'https://query1.finance.yahoo.com/v7/finance/download'
+QUOTE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close'] # same as DataReader
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+class _ConnectionPool(object):
+    """
+    Idle keep-alive connections to one host.
+    """
+    def __init__(self, host, port, ssl_context=None, size=16):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.size = size
+        self.opened = 0 # number of connections opened
+        self._idle = []
+
+    async def acquire(self):
+        """
+        Return [reader, writer, reused].
+        """
+        while len(self._idle) > 0:
+            [reader, writer] = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return [reader, writer, True]
+            writer.close()
+        [reader, writer] = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        self.opened += 1
+        return [reader, writer, False]
+
+    def release(self, reader, writer, keep_alive=True):
+        if keep_alive and len(self._idle) < self.size and not writer.is_closing():
+            self._idle.append([reader, writer])
+        else:
+            writer.close()
+
+    def close(self):
+        for [reader, writer] in self._idle:
+            writer.close()
+        self._idle = []
+
+async def _read_response(reader):
+    """
+    Read one HTTP/1.1 response.
+    Return: [status, headers, body, keep_alive]
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('connection closed by server')
+    parts = line.decode('latin-1').split(None, 2)
+    version = parts[0]
+    status = int(parts[1])
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        [key, value] = line.decode('latin-1').split(':', 1)
+        headers[key.strip().lower()] = value.strip()
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline() # no trailers expected
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+        body = bytes(body)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read() # until the server closes
+        keep_alive = False
+    return [status, headers, body, keep_alive]
+
+def parse_quotes_csv(text):
+    """
+    Parse history quotes in CSV, e.g. from Yahoo Finance, into a DataFrame indexed by 'Date'.
+    """
+    quotes = pd.read_csv(io.StringIO(text), index_col='Date', parse_dates=True, na_values=['null'])
+    columns = [c for c in QUOTE_COLUMNS if c in quotes.columns]
+    return quotes[columns].sort_index()
+
+class QuoteDownloader(object):
+    """
+    Download history quotes of many symbols concurrently.
+    """
+    def __init__(self, base_url=YAHOO_DOWNLOAD_URL, concurrency=16, retries=3, backoff=0.5, timeout=30):
+        """
+        base_url: URL of the CSV download service, requests are base_url/<symbol>?period1=...
+        concurrency: max number of requests in flight, also the max idle connections kept
+        retries: max number of retries of a failed request
+        backoff: delay in seconds before the first retry, doubled for every next one
+        timeout: timeout in seconds of one request
+        """
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.errors = dict() # <symbol:error message> of the last download
+        self.bytes_downloaded = 0
+        self.requests = 0
+        self.connections = 0 # connections opened by the last download
+
+    def _request(self, sym, start_date, end_date):
+        # Yahoo Finance takes the period in epoch seconds, the end is exclusive
+        epoch = dt.date(1970, 1, 1)
+        params = {'period1': (start_date - epoch).days * 86400,
+                  'period2': (end_date - epoch).days * 86400 + 86400,
+                  'interval': '1d',
+                  'events': 'history'}
+        url = urlsplit(self.base_url)
+        path = url.path + '/' + quote(sym) + '?' + urlencode(params)
+        return ('GET %s HTTP/1.1\r\n'
+                'Host: %s\r\n'
+                'User-Agent: Mozilla/5.0\r\n'
+                'Accept: text/csv\r\n'
+                'Connection: keep-alive\r\n\r\n' %(path, url.netloc)).encode('latin-1')
+
+    async def _exchange(self, request, pool):
+        """
+        Send a request and read its response on a connection of the pool.
+        Return: [status, body]
+        """
+        [reader, writer, reused] = await pool.acquire()
+        try:
+            writer.write(request)
+            await writer.drain()
+            [status, headers, body, keep_alive] = await _read_response(reader)
+        except BaseException:
+            writer.close() # also when cancelled by the timeout
+            raise
+        pool.release(reader, writer, keep_alive)
+        return [status, body]
+
+    async def _fetch(self, sym, start_date, end_date, pool, semaphore):
+        request = self._request(sym, start_date, end_date)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff * 2**(attempt-1))
+            async with semaphore:
+                try:
+                    # the timeout covers connecting, sending and the response
+                    [status, body] = await asyncio.wait_for(self._exchange(request, pool), self.timeout)
+                except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    error = 'request failed: %r' %e
+                    continue
+            self.requests += 1
+            self.bytes_downloaded += len(body)
+            instrument.count('quote_requests')
+            instrument.count('bytes_downloaded', len(body))
+            if status == 200:
+                try:
+                    quotes = parse_quotes_csv(body.decode('utf-8'))
+                except (ValueError, KeyError) as e: # e.g. an HTML page, not retried
+                    error = 'invalid quotes: %r' %e
+                    break
+                return quotes[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
+            error = 'HTTP %d' %status
+            if status not in RETRY_STATUS:
+                break # e.g. 404 for unknown symbols
+        self.errors[sym] = error
+        return None
+
+    async def download_async(self, symbols, start_date, end_date):
+        """
+        Coroutine of download().
+        """
+        starts = start_date if type(start_date) == dict else {sym: start_date for sym in symbols}
+        url = urlsplit(self.base_url)
+        ssl_context = ssl.create_default_context() if url.scheme == 'https' else None
+        port = url.port if url.port != None else (443 if url.scheme == 'https' else 80)
+        pool = _ConnectionPool(url.hostname, port, ssl_context, size=self.concurrency)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            results = await asyncio.gather(*[self._fetch(sym, starts[sym], end_date, pool, semaphore) for sym in symbols])
+        finally:
+            pool.close()
+        self.connections = pool.opened
+        return {sym: q for sym, q in zip(symbols, results) if q is not None and not q.empty}
+
+    def download(self, symbols, start_date, end_date):
+        """
+        Download history quotes of symbols between start_date and end_date (datetime.date).
+        start_date can also be a dict of <symbol:date>, e.g. the last stored date of each symbol.
+        Return: a dict of <symbol:DataFrame>, the failed symbols are in self.errors.
+        """
+        self.errors = dict()
+        t = time.time()
+        coro = self.download_async(list(symbols), start_date, end_date)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            quotes = asyncio.run(coro)
+        else:
+            # called from a running event loop, e.g. in Jupyter, run on a new loop in another thread
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                quotes = pool.submit(asyncio.run, coro).result()
+        for sym, error in self.errors.items():
+            print('Error: failed to get quotes for %s: %s' %(sym, error))
+        print('Downloaded %d of %d symbols in %.1f seconds.' %(len(quotes), len(symbols), time.time() - t))
+        return quotes
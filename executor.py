@@ -0,0 +1,161 @@
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from stock_analysis import instrument
+
+#
+# Process pool for CPU-bound work on index components.
+#
+# The quotes of all components are packed into shared memory once, and the worker processes
+# read the rows of their symbols from it, so no DataFrame is pickled per task. Each task is a
+# chunk of consecutive symbols, and the results are returned in the order of the symbols.
+#
+
+class SharedQuotes(object):
+    """
+    History quotes of many symbols packed into two shared memory blocks:
+        dates  - int64 nanoseconds since epoch, the rows of all symbols one after another
+        values - float64 matrix of rows x columns
+    The rows of the i-th symbol are [offsets[i], offsets[i+1]).
+    """
+    def __init__(self, spec, blocks):
+        self.spec = spec # picklable description, see attach()
+        self.symbols = spec['symbols']
+        self.columns = spec['columns']
+        self.offsets = spec['offsets']
+        self._pos = {sym: i for i, sym in enumerate(self.symbols)}
+        self._blocks = blocks
+        rows = self.offsets[-1]
+        self.dates = np.ndarray((rows,), dtype=np.int64, buffer=blocks['dates'].buf)
+        self.values = np.ndarray((rows, len(self.columns)), dtype=np.float64, buffer=blocks['values'].buf)
+
+    @classmethod
+    def create(cls, quotes):
+        """
+        Pack quotes into new shared memory blocks.
+        quotes: dict of <symbol:DataFrame>, the columns of the first one are used for all
+        """
+        symbols = [sym for sym in quotes.keys() if not quotes[sym].empty]
+        columns = [str(c) for c in quotes[symbols[0]].columns] if len(symbols) > 0 else []
+        offsets = np.concatenate([[0], np.cumsum([len(quotes[sym]) for sym in symbols])]).astype(int).tolist()
+        rows = offsets[-1]
+        blocks = {'dates': shared_memory.SharedMemory(create=True, size=max(rows*8, 1)),
+                  'values': shared_memory.SharedMemory(create=True, size=max(rows*len(columns)*8, 1))}
+        spec = {'symbols': symbols, 'columns': columns, 'offsets': offsets,
+                'names': {key: shm.name for key, shm in blocks.items()}}
+        shared = cls(spec, blocks)
+        for i, sym in enumerate(symbols):
+            quote = quotes[sym].reindex(columns=columns)
+            shared.dates[offsets[i]:offsets[i+1]] = pd.to_datetime(quote.index).values.astype('datetime64[ns]').astype(np.int64)
+            shared.values[offsets[i]:offsets[i+1]] = quote.values
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Open the blocks created by the parent process, from its SharedQuotes.spec.
+        The worker processes share the parent's resource tracker, so only the creator unlinks them.
+        """
+        blocks = {key: shared_memory.SharedMemory(name=name) for key, name in spec['names'].items()}
+        return cls(spec, blocks)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def keys(self):
+        return list(self.symbols)
+
+    def __getitem__(self, sym):
+        """
+        A copy of the quotes of sym, as a DataFrame indexed by date.
+        """
+        i = self._pos[sym]
+        rows = slice(self.offsets[i], self.offsets[i+1])
+        index = pd.DatetimeIndex(self.dates[rows].view('datetime64[ns]'), name='Date')
+        return DataFrame(self.values[rows].copy(), index=index, columns=self.columns)
+
+    def subset(self, symbols):
+        """
+        Return a dict of <symbol:DataFrame>.
+        """
+        return {sym: self[sym] for sym in symbols}
+
+    def close(self):
+        # the arrays must be released before the buffers
+        self.dates = None
+        self.values = None
+        for shm in self._blocks.values():
+            shm.close()
+
+    def unlink(self):
+        for shm in self._blocks.values():
+            shm.unlink()
+
+# state of a worker process, set by _init_worker()
+_worker = dict()
+
+def _init_worker(spec, func, context):
+    # a forked worker inherits the Instrumentation active in the parent, whose counts would be
+    # lost with the worker, so only the one of each chunk records, see Index._run_chunk()
+    instrument._active = None
+    _worker['quotes'] = SharedQuotes.attach(spec)
+    _worker['func'] = func
+    _worker['context'] = context
+
+def _run_chunk(task):
+    [iStart, iEnd] = task
+    quotes = _worker['quotes']
+    return _worker['func'](_worker['context'], quotes.subset(quotes.symbols[iStart:iEnd]))
+
+class ComponentExecutor(object):
+    """
+    Process pool computing results for chunks of symbols.
+    """
+    def __init__(self, workers=None, chunksize=None):
+        """
+        workers: number of worker processes, default to the number of CPUs
+        chunksize: number of symbols per task, default to about 4 tasks per worker, at most 256
+        """
+        self.workers = workers if workers != None else os.cpu_count()
+        self.chunksize = chunksize
+
+    def chunks(self, num):
+        """
+        Split num symbols into [start, end) chunks.
+        """
+        chunksize = self.chunksize
+        if chunksize == None:
+            chunksize = min(256, max(1, int(np.ceil(num / (self.workers * 4)))))
+        return [(i, min(i + chunksize, num)) for i in range(0, num, chunksize)]
+
+    def map(self, func, quotes, context=None):
+        """
+        Apply func to consecutive chunks of symbols in the worker processes.
+
+        func: module-level function func(context, quotes) -> result, where quotes is a dict of
+              <symbol:DataFrame> of one chunk
+        quotes: dict of <symbol:DataFrame>
+        context: argument passed to func, sent once to each worker, e.g. an Index
+        Return: a list of results, in the order of the chunks.
+        """
+        symbols = [sym for sym in quotes.keys() if not quotes[sym].empty]
+        tasks = self.chunks(len(symbols))
+        if self.workers <= 1 or len(tasks) <= 1:
+            # no worker processes needed
+            return [func(context, {sym: quotes[sym] for sym in symbols[iStart:iEnd]}) for [iStart, iEnd] in tasks]
+        shared = SharedQuotes.create(quotes)
+        try:
+            pool = mp.Pool(processes=min(self.workers, len(tasks)), initializer=_init_worker, initargs=(shared.spec, func, context))
+            try:
+                results = pool.map(_run_chunk, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+            return results
+        finally:
+            shared.close()
+            shared.unlink()
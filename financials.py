@@ -0,0 +1,156 @@
+import re
+import os
+from html.parser import HTMLParser
+from urllib.request import Request, urlopen
+import pandas as pd
+from pandas import DataFrame
+from stock_analysis import instrument
+
+#
+# Financial statements from saved Google Finance pages, without a browser.
+#
+# The statement page of a symbol is downloaded once and saved as HTML. All statements are in
+# that page, each one in a table with id 'fs-table' inside a div, e.g. 'incinterimdiv' for the
+# quarterly income statement which the browser shows first. The parser extracts the quarterly
+# tables into the same 'Entries'-indexed DataFrames as parse_google_financial_table().
+#
+FINANCIALS_URL = 'https://www.google.com/finance?q=%s%%3A%s&fstype=ii'
+
+# statement: [div id of the quarterly table, keyword of the table]
+STATEMENT_TABLES = {'income': ['incinterimdiv', 'Revenue'],
+                    'balance': ['balinterimdiv', 'Total Assets'],
+                    'cashflow': ['casinterimdiv', 'Amortization']}
+
+class _FinancialTableParser(HTMLParser):
+    """
+    Collect the rows of text of all tables with id 'fs-table', with the id of the enclosing div.
+    """
+    def __init__(self):
+        super(_FinancialTableParser, self).__init__(convert_charrefs=True)
+        self.tables = [] # [div id, rows], rows are lists of cell text
+        self._divs = []  # ids of the open divs
+        self._table = None
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'div':
+            self._divs.append(attrs.get('id'))
+        elif tag == 'table' and attrs.get('id') == 'fs-table':
+            div = next((d for d in reversed(self._divs) if d != None), None)
+            self._table = [div, []]
+        elif self._table != None:
+            if tag == 'tr':
+                self._row = []
+            elif tag in ('td', 'th') and self._row != None:
+                self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'div':
+            if len(self._divs) > 0:
+                self._divs.pop()
+        elif self._table == None:
+            return
+        elif tag in ('td', 'th') and self._cell != None:
+            self._row.append(' '.join(''.join(self._cell).split()))
+            self._cell = None
+        elif tag == 'tr' and self._row != None:
+            if len(self._row) > 0:
+                self._table[1].append(self._row)
+            self._row = None
+        elif tag == 'table':
+            self.tables.append(self._table)
+            self._table = None
+
+    def handle_data(self, data):
+        if self._cell != None:
+            self._cell.append(data)
+
+def _table_to_df(rows):
+    """
+    Convert rows of a statement table into DataFrame, like parse_google_financial_table().
+    """
+    # Get quaters from the first row, e.g.
+    # 'In Millions of USD (except for per share items) 3 months ending 2016-10-31 3 months ending 2016-07-31 ...'
+    quarters = re.findall(r'([0-9]+-[0-9]+-[0-9]+)', ' '.join(rows[0]))
+    if len(quarters) == 0:
+        return DataFrame()
+    lines = list()
+    seen = set()
+    for row in rows[1:]:
+        l = ' '.join(row).split(' ')
+        if len(l) <= len(quarters):
+            continue
+        values = l[-len(quarters):] # the right part
+        key = ' '.join(l[:-len(quarters)]) # the left part
+        line = tuple([key] + values)
+        if line not in seen: # drop duplicates
+            seen.add(line)
+            lines.append(line)
+    colstr = ['Entries'] + quarters
+    fin_df = DataFrame(lines, columns=colstr)
+    fin_df = fin_df.set_index('Entries')
+    return fin_df
+
+def _statement_segments(html):
+    """
+    The parts of the page with the statement tables, from the div enclosing each table to the
+    end of the table, so the rest of the page (scripts, charts, news) is not parsed.
+    """
+    segments = []
+    for m in re.finditer(r'<table[^>]*id=["\']?fs-table', html):
+        start = html.rfind('<div', 0, m.start())
+        end = html.find('</table>', m.end())
+        if end < 0:
+            end = len(html)
+        segments.append(html[max(start, 0):end + len('</table>')])
+    return segments
+
+def parse_financials_html(html):
+    """
+    Parse the quarterly statements from the HTML of a Google Finance statement page.
+    Return: [income, balance, cashflow] DataFrames, empty if not found.
+    """
+    parser = _FinancialTableParser()
+    for segment in _statement_segments(html):
+        parser.feed(segment)
+        parser._divs = [] # segments are not nested
+    parser.close()
+    statements = []
+    for name in ['income', 'balance', 'cashflow']:
+        [div, keyword] = STATEMENT_TABLES[name]
+        rows = next((rows for d, rows in parser.tables if d == div and len(rows) > 1), None)
+        if rows == None:
+            # no div ids, the first table with the keyword
+            rows = next((rows for d, rows in parser.tables if any(keyword in ' '.join(r) for r in rows)), None)
+        statements.append(_table_to_df(rows) if rows != None else DataFrame())
+    return statements
+
+def capture_financials(sym, exchange, filename):
+    """
+    Download the Google Finance statement page of a symbol and save its HTML.
+    Return: True if saved.
+    """
+    url = FINANCIALS_URL %(exchange, sym)
+    try:
+        with urlopen(Request(url, headers={'User-Agent': 'Mozilla/5.0'})) as resp:
+            html = resp.read()
+    except IOError as e:
+        print('Error: failed to get link: %s: %s' %(url, e))
+        return False
+    instrument.count('financials_requests')
+    instrument.count('bytes_downloaded', len(html))
+    path = os.path.dirname(filename)
+    if path != '' and not os.path.isdir(path):
+        os.makedirs(path)
+    with open(filename, 'wb') as f:
+        f.write(html)
+    return True
+
+def load_financials_html(filename):
+    """
+    Parse a saved statement page, see parse_financials_html().
+    """
+    with open(filename, encoding='utf-8', errors='replace') as f:
+        return parse_financials_html(f.read())
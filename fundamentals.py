@@ -0,0 +1,217 @@
+import os
+import csv
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from stock_analysis.utils import *
+from stock_analysis import instrument
+try:
+    import fcntl
+except ImportError: # not on Windows
+    fcntl = None
+
+#
+# Batched fundamentals of symbols from Yahoo Finance quotes.csv, with an on-disk cache.
+#
+# The same fields as get_symbol_yahoo_stats_yql() are requested for batches of symbols in one
+# request each, and the batches run concurrently. Every field of every symbol is cached with
+# its download time in a JSON file, and it is downloaded again only when it is older than the
+# TTL of the field, e.g. market cap and volume daily, EPS estimates weekly. Symbols a batch
+# returned nothing for, e.g. unknown ones or a failed request, are cached as [None, time] and
+# requested again after a shorter failure TTL, so the worker processes of Index.get_stats()
+# don't request them again for every chunk. The processes sharing a cache file merge their
+# fields into it under a file lock (<cachefile>.lock), on platforms without fcntl the cache is
+# single-writer, i.e. saves of concurrent processes can lose each other's fields.
+#
+YAHOO_QUOTES_URL = 'http://download.finance.yahoo.com/d/quotes.csv'
+
+DAY = 24 * 3600
+# field: [quotes.csv tag, TTL in seconds, numeric]
+FUNDAMENTAL_FIELDS = {'Name':                        ['n',  30*DAY, False],
+                      'Exchange':                    ['x',  30*DAY, False],
+                      'MarketCap':                   ['j1', DAY,    True],
+                      'Volume':                      ['v',  DAY,    True],
+                      'AverageDailyVolume':          ['a2', DAY,    True],
+                      'BookValue':                   ['b4', 7*DAY,  True],
+                      'P/E':                         ['r',  DAY,    True],
+                      'PEG':                         ['r5', DAY,    True],
+                      'Price/Sales':                 ['p5', DAY,    True],
+                      'Price/Book':                  ['p6', DAY,    True],
+                      'EBITDA':                      ['j4', 7*DAY,  True],
+                      'EPS':                         ['e',  7*DAY,  True],
+                      'EPSEstimateNextQuarter':      ['e9', 7*DAY,  True],
+                      'EPSEstimateCurrentYear':      ['e7', 7*DAY,  True],
+                      'EPSEstimateNextYear':         ['e8', 7*DAY,  True],
+                      'OneyrTargetPrice':            ['t8', 7*DAY,  True],
+                      'PriceEPSEstimateCurrentYear': ['r6', DAY,    True],
+                      'PriceEPSEstimateNextYear':    ['r7', DAY,    True],
+                      'ShortRatio':                  ['s7', DAY,    True],
+                      'Dividend/Share':              ['d',  7*DAY,  True],
+                      'DividendYield':               ['y',  DAY,    True],
+                      'DividendPayDate':             ['r1', 7*DAY,  False],
+                      'ExDividendDate':              ['q',  7*DAY,  False]}
+
+def fundamental_fields(exclude_name=False):
+    """
+    Fields in the order of get_symbol_yahoo_stats_yql().
+    """
+    return [f for f in FUNDAMENTAL_FIELDS.keys() if not (exclude_name and f == 'Name')]
+
+class FundamentalsFetcher(object):
+    """
+    Fetch fundamentals of symbols in concurrent batches, cached on disk.
+    """
+    def __init__(self, cachefile='./data/fundamentals.json', base_url=YAHOO_QUOTES_URL, batch=200, workers=8, ttl=None, failure_ttl=3600):
+        """
+        cachefile: JSON file of the cache, None to cache in memory only
+        batch: number of symbols per request
+        workers: number of requests in flight
+        ttl: dict of <field:seconds> overriding the TTL in FUNDAMENTAL_FIELDS
+        failure_ttl: seconds before the symbols a batch returned nothing for are requested again
+        """
+        self.cachefile = cachefile
+        self.base_url = base_url
+        self.batch = batch
+        self.workers = workers
+        self.ttl = {f: v[1] for f, v in FUNDAMENTAL_FIELDS.items()}
+        if ttl != None:
+            self.ttl.update(ttl)
+        self.failure_ttl = failure_ttl
+        self.cache = dict() # <symbol:<field:[value, time]>>
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        if self.cachefile == None or not os.path.isfile(self.cachefile):
+            return
+        with self._lock:
+            with open(self.cachefile) as f:
+                self.cache = json.load(f)
+
+    def save(self):
+        """
+        Save the cache, merged with what other processes saved in the meantime. The merge and
+        write are under a file lock, where fcntl is available.
+        """
+        if self.cachefile == None:
+            return
+        with self._lock:
+            path = os.path.dirname(self.cachefile)
+            if path != '' and not os.path.isdir(path):
+                os.makedirs(path)
+            with open(self.cachefile + '.lock', 'w') as lock:
+                if fcntl != None:
+                    fcntl.flock(lock, fcntl.LOCK_EX) # released when the lock file is closed
+                if os.path.isfile(self.cachefile):
+                    with open(self.cachefile) as f:
+                        saved = json.load(f)
+                    for sym, fields in saved.items():
+                        mine = self.cache.setdefault(sym, dict())
+                        for field, [value, t] in fields.items():
+                            if field not in mine or mine[field][1] < t:
+                                mine[field] = [value, t]
+                with tempfile.NamedTemporaryFile(mode='w', dir=path or '.', delete=False,
+                                                 prefix=os.path.basename(self.cachefile) + '.',
+                                                 suffix='.tmp') as f:
+                    json.dump(self.cache, f)
+                os.replace(f.name, self.cachefile)
+
+    def _stale_fields(self, sym, fields, now):
+        cached = self.cache.get(sym, dict())
+        ttl = lambda f: self.ttl[f] if cached[f][0] is not None else self.failure_ttl
+        return [f for f in fields if f not in cached or now - cached[f][1] > ttl(f)]
+
+    def _fetch_batch(self, symbols, fields):
+        """
+        Download fields of a batch of symbols by one request.
+        Return: dict of <symbol:<field:value>>.
+        """
+        tags = 's' + ''.join([FUNDAMENTAL_FIELDS[f][0] for f in fields]) # symbol first
+        url = self.base_url + '?' + urlencode({'s': '+'.join(symbols), 'f': tags}, safe='+^')
+        try:
+            with urlopen(url) as resp:
+                raw = resp.read()
+        except IOError as e:
+            print('Error: failed to download fundamentals of %d symbols: %s' %(len(symbols), e))
+            return dict()
+        instrument.count('fundamentals_requests')
+        instrument.count('bytes_downloaded', len(raw))
+        rows = [row for row in csv.reader(raw.decode('utf-8').strip().splitlines()) if len(row) == len(fields) + 1]
+        if len(rows) == 0:
+            return dict()
+        values = DataFrame(rows, columns=['Symbol'] + fields).set_index('Symbol')
+        values = values[~values.index.duplicated(keep='last')] # a symbol requested twice
+        for f in fields:
+            if FUNDAMENTAL_FIELDS[f][2]:
+                values[f] = str2nums(values[f], m2b=(f == 'MarketCap')).values
+        return values.to_dict(orient='index')
+
+    def fetch(self, symbols, exclude_name=False):
+        """
+        Get fundamentals of symbols, only the stale fields are downloaded.
+        Return: DataFrame indexed by 'Symbol', with the columns of get_symbol_yahoo_stats_yql().
+        """
+        sym_list = str2list(symbols)
+        if sym_list == None:
+            return DataFrame()
+        fields = fundamental_fields(exclude_name)
+        now = time.time()
+        # group the symbols by their stale fields, so each batch requests the same tags
+        groups = dict()
+        with self._lock:
+            for sym in sym_list:
+                stale = tuple(self._stale_fields(sym, fields, now))
+                if len(stale) > 0:
+                    groups.setdefault(stale, []).append(sym)
+            misses = sum([len(syms) for syms in groups.values()])
+            self.misses += misses
+            self.hits += len(sym_list) - misses
+        instrument.count('fundamentals_cache_misses', misses)
+        instrument.count('fundamentals_cache_hits', len(sym_list) - misses)
+        tasks = [(list(stale), syms[i:i+self.batch]) for stale, syms in groups.items() for i in range(0, len(syms), self.batch)]
+        if len(tasks) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+                results = list(pool.map(lambda task: [task[0], task[1], self._fetch_batch(task[1], task[0])], tasks))
+            with self._lock:
+                for [stale, syms, batch] in results:
+                    for sym in syms:
+                        cached = self.cache.setdefault(sym, dict())
+                        values = batch.get(sym)
+                        for f in stale:
+                            if values != None:
+                                cached[f] = [values[f], now]
+                            elif f not in cached or cached[f][0] is None:
+                                cached[f] = [None, now] # failed
+                            else:
+                                # failed, the older value is kept and requested again after failure_ttl
+                                cached[f] = [cached[f][0], now - max(self.ttl[f] - self.failure_ttl, 0)]
+                self.save()
+
+        lines = []
+        with self._lock:
+            for sym in sym_list:
+                cached = self.cache.get(sym, dict())
+                lines.append([sym] + [cached[f][0] if f in cached and cached[f][0] is not None else np.nan for f in fields])
+        stats = DataFrame(lines, columns=['Symbol'] + fields)
+        stats = stats.drop_duplicates()
+        stats = stats.set_index('Symbol')
+        return stats
+
+_fetchers = dict()
+_fetchers_lock = threading.Lock()
+
+def get_fundamentals(symbols, exclude_name=False, cachefile='./data/fundamentals.json'):
+    """
+    Get fundamentals of symbols by the FundamentalsFetcher of cachefile, created once per process.
+    """
+    with _fetchers_lock:
+        if cachefile not in _fetchers:
+            _fetchers[cachefile] = FundamentalsFetcher(cachefile)
+        fetcher = _fetchers[cachefile]
+    return fetcher.fetch(symbols, exclude_name)
@@ -0,0 +1,340 @@
+import json
+from collections import deque
+import numpy as np
+
+from stock_analysis.utils import moving_average, wilder_averages, stochastic_oscillator
+
+#
+# Incremental indicators, updated bar by bar in O(1).
+#
+# Each indicator buffers the first bars until it has enough of them for the batch
+# initialization (warmup), then it is seeded by the batch functions in utils.py and only
+# applies the recursion for every new bar. So after the warmup the values are the same as
+# the ones of Symbol.ema(), sma(), rsi(), macd(), stochastic() and roc() over the full history.
+#
+# Example:
+#     ema = EMA.from_symbol(aapl, n=10)
+#     ema.save('./data/AAPL/ema10.json')
+#     ...
+#     ema = load_indicator('./data/AAPL/ema10.json')
+#     ema.update_bar(new_quote) # a row of Symbol.quotes
+#
+
+class IncrementalIndicator(object):
+    """
+    Base class of incremental indicators.
+    """
+    params = [] # names of the constructor parameters
+    warmup = 1  # number of bars needed for seeding
+
+    def __init__(self):
+        self.buffer = [] # bars received before seeding
+        self.seeded = False
+        self.value = np.nan
+
+    @classmethod
+    def from_symbol(cls, symbol, **kwargs):
+        """
+        Create the indicator and seed it from the history quotes of a Symbol.
+        """
+        ind = cls(**kwargs)
+        ind.seed(ind._bars(symbol.quotes))
+        return ind
+
+    def _bars(self, quotes):
+        # the input of seed() and update() from quotes
+        return np.asarray(quotes['Adj Close'], dtype=float)
+
+    def update_bar(self, bar):
+        """
+        Update with a bar of quotes, e.g. a row of Symbol.quotes.
+        """
+        return self.update(float(bar['Adj Close']))
+
+    def update(self, x):
+        """
+        Push the price of one new bar, return the updated value.
+        """
+        if self.seeded:
+            self.value = self._update(x)
+        else:
+            self.buffer.append(x)
+            if len(self.buffer) >= self.warmup:
+                self.seed(self.buffer)
+        return self.value
+
+    def seed(self, bars):
+        """
+        Initialize the state from the history, by the batch calculation.
+        """
+        bars = list(bars)
+        if len(bars) < self.warmup:
+            self.buffer = bars
+            self.seeded = False
+            self.value = np.nan
+            return
+        self._seed(np.asarray(bars, dtype=float))
+        self.buffer = []
+        self.seeded = True
+
+    def to_dict(self):
+        state = {k: v for k, v in self.__dict__.items() if k not in self.params}
+        return {'class': self.__class__.__name__,
+                'params': {k: getattr(self, k) for k in self.params},
+                'state': _to_json(state)}
+
+    @classmethod
+    def from_dict(cls, d):
+        ind = cls(**d['params'])
+        for k, v in d['state'].items():
+            setattr(ind, k, v)
+        ind._restore()
+        return ind
+
+    def _restore(self):
+        # convert JSON lists back into the original containers
+        pass
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+def load_indicator(filename):
+    """
+    Load an incremental indicator saved by IncrementalIndicator.save().
+    """
+    with open(filename) as f:
+        d = json.load(f)
+    classes = {c.__name__: c for c in [EMA, SMA, RSI, MACD, Stochastic, ROC]}
+    return classes[d['class']].from_dict(d)
+
+def _to_json(obj):
+    if isinstance(obj, dict):
+        return {k: _to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, deque)):
+        return [_to_json(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, IncrementalIndicator):
+        return obj.to_dict()
+    return obj
+
+class EMA(IncrementalIndicator):
+    """
+    Exponential Moving Average, see utils.moving_average().
+    """
+    params = ['n']
+
+    def __init__(self, n=10):
+        super(EMA, self).__init__()
+        self.n = n
+        self.warmup = n
+
+    def _seed(self, x):
+        self.value = moving_average(x, self.n, type='exponential')[-1]
+
+    def _update(self, x):
+        m = 2/(self.n+1) # multiplier
+        return (x - self.value) * m + self.value
+
+class SMA(IncrementalIndicator):
+    """
+    Simple Moving Average, see utils.moving_average().
+    The values are the same as the batch ones from the (n+1)-th bar on.
+    """
+    params = ['n']
+
+    def __init__(self, n=20):
+        super(SMA, self).__init__()
+        self.n = n
+        self.warmup = n + 1
+        self.window = deque(maxlen=n)
+        self.total = 0.0
+
+    def _seed(self, x):
+        self.window = deque(x[-self.n:].tolist(), maxlen=self.n)
+        self.total = float(np.sum(x[-self.n:]))
+        self.value = moving_average(x, self.n, type='simple')[-1]
+
+    def _update(self, x):
+        self.total += x - self.window[0]
+        self.window.append(x)
+        return self.total / self.n
+
+    def _restore(self):
+        self.window = deque(self.window, maxlen=self.n)
+
+class RSI(IncrementalIndicator):
+    """
+    Relative Strength Index, see utils.relative_strength_index().
+    The batch seed uses n+1 price changes, so n+2 bars are needed for the warmup.
+    """
+    params = ['n']
+
+    def __init__(self, n=14):
+        super(RSI, self).__init__()
+        self.n = n
+        self.warmup = n + 2
+        self.up = np.nan
+        self.down = np.nan
+        self.last = np.nan
+
+    def _seed(self, x):
+        [up, down] = wilder_averages(x, self.n)
+        self.up = up[-1]
+        self.down = down[-1]
+        self.last = x[-1]
+        self.value = self._rsi()
+
+    def _update(self, x):
+        d = x - self.last
+        gain = d if d > 0 else 0
+        loss = 0 if d > 0 else -d # losses should be positive
+        self.up = (self.up*(self.n - 1) + gain)/self.n
+        self.down = (self.down*(self.n - 1) + loss)/self.n
+        self.last = x
+        return self._rsi()
+
+    def _rsi(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(100. - 100./(1. + np.float64(self.up)/self.down))
+
+class MACD(IncrementalIndicator):
+    """
+    MACD(fast, slow, signal), see Symbol.macd().
+    The value is [MACD Line, Signal Line, Histogram].
+    """
+    params = ['fast', 'slow', 'signal']
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        super(MACD, self).__init__()
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+        self.warmup = max(fast, slow, signal)
+        self.fastema = EMA(fast)
+        self.slowema = EMA(slow)
+        self.signalema = EMA(signal)
+        self.value = [np.nan, np.nan, np.nan]
+
+    def _seed(self, x):
+        self.fastema.seed(x)
+        self.slowema.seed(x)
+        macdline = moving_average(x, self.fast, type='exponential') - moving_average(x, self.slow, type='exponential')
+        self.signalema.seed(macdline)
+        self.value = self._macd()
+
+    def _update(self, x):
+        self.fastema.update(x)
+        self.slowema.update(x)
+        self.signalema.update(self.fastema.value - self.slowema.value)
+        return self._macd()
+
+    def _macd(self):
+        macdline = self.fastema.value - self.slowema.value
+        signal = self.signalema.value
+        return [macdline, signal, macdline - signal]
+
+    def _restore(self):
+        self.fastema = EMA.from_dict(self.fastema)
+        self.slowema = EMA.from_dict(self.slowema)
+        self.signalema = EMA.from_dict(self.signalema)
+
+class Stochastic(IncrementalIndicator):
+    """
+    Stochastic oscillator, see utils.stochastic_oscillator().
+    The value is [%K, %D], it needs bars with 'Adj Close', 'Close', 'High' and 'Low'.
+    The highest high and lowest low are kept in monotonic queues, so an update is O(1) amortized.
+    """
+    params = ['nK', 'nD']
+
+    def __init__(self, nK=14, nD=3):
+        super(Stochastic, self).__init__()
+        self.nK = nK
+        self.nD = nD
+        self.warmup = nK + nD
+        self.count = 0         # number of bars
+        self.highs = deque()   # [bar number, high] in decreasing order of high
+        self.lows = deque()    # [bar number, low] in increasing order of low
+        self.ks = deque(maxlen=nD) # the last nD values of %K
+        self.value = [np.nan, np.nan]
+
+    def _bars(self, quotes):
+        ratio = quotes['Adj Close'] / quotes['Close']
+        high = quotes['High'] * ratio # adjusted high
+        low = quotes['Low'] * ratio   # adjusted low
+        return np.column_stack([quotes['Adj Close'], high, low])
+
+    def update_bar(self, bar):
+        ratio = bar['Adj Close'] / bar['Close']
+        return self.update([bar['Adj Close'], bar['High'] * ratio, bar['Low'] * ratio])
+
+    def update(self, x):
+        """
+        Push [Adj Close, adjusted High, adjusted Low] of one new bar.
+        """
+        return super(Stochastic, self).update(list(x))
+
+    def _seed(self, x):
+        [K, D] = stochastic_oscillator(x[:, 0], x[:, 1], x[:, 2], self.nK, self.nD)
+        window = x[-self.nK:]
+        self.count = len(x) - len(window)
+        self.highs = deque()
+        self.lows = deque()
+        for [close, high, low] in window:
+            self._push(high, low)
+        self.ks = deque(K[-self.nD:].tolist(), maxlen=self.nD)
+        self.value = [K[-1], D[-1]]
+
+    def _push(self, high, low):
+        i = self.count
+        while len(self.highs) > 0 and self.highs[-1][1] <= high:
+            self.highs.pop()
+        self.highs.append([i, high])
+        while len(self.lows) > 0 and self.lows[-1][1] >= low:
+            self.lows.pop()
+        self.lows.append([i, low])
+        # drop the bars out of the window
+        while self.highs[0][0] <= i - self.nK:
+            self.highs.popleft()
+        while self.lows[0][0] <= i - self.nK:
+            self.lows.popleft()
+        self.count += 1
+
+    def _update(self, x):
+        [close, high, low] = x
+        self._push(high, low)
+        highest = self.highs[0][1]
+        lowest = self.lows[0][1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            K = float((close - lowest) / np.float64(highest - lowest) * 100)
+        self.ks.append(K)
+        return [K, sum(self.ks) / self.nD]
+
+    def _restore(self):
+        self.highs = deque(self.highs)
+        self.lows = deque(self.lows)
+        self.ks = deque(self.ks, maxlen=self.nD)
+
+class ROC(IncrementalIndicator):
+    """
+    Rate of Change over a window of n periods, see utils.rate_of_change().
+    """
+    params = ['n']
+
+    def __init__(self, n=10):
+        super(ROC, self).__init__()
+        self.n = n
+        self.warmup = n
+        self.window = deque(maxlen=n)
+
+    def _seed(self, x):
+        self.window = deque(x[-self.n:].tolist(), maxlen=self.n)
+        self.value = (self.window[-1]/self.window[0] - 1) * 100
+
+    def _update(self, x):
+        self.window.append(x)
+        return (self.window[-1]/self.window[0] - 1) * 100
+
+    def _restore(self):
+        self.window = deque(self.window, maxlen=self.n)
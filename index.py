@@ -1,8 +1,17 @@
 from stock_analysis.utils import *
 from stock_analysis.symbol import *
-
+from stock_analysis.universe import QuoteMatrix
+from stock_analysis.executor import ComponentExecutor
+from stock_analysis.downloader import QuoteDownloader
+from stock_analysis.scoring import Scorer
+from stock_analysis import instrument
+from stock_analysis.instrument import Instrumentation
+
+import shutil
+import hashlib
 import multiprocessing as mp
-from multiprocessing.dummy import Pool as ThreadPool
+from concurrent.futures import ThreadPoolExecutor
+
 
 class Index(object):
     """
@@ -14,6 +23,10 @@ class Index(object):
         self.datapath = os.path.normpath(datapath + '/' + name)
         self.datafile = self.datapath + '/components.csv'
         self.components = components # index 'Symbol'
+        self.benchmark = None # shared Benchmark of self.sym, see _get_benchmark()
+        self.downloader = QuoteDownloader() # for the quotes of components
+        self.quote_errors = dict() # <symbol:error message> of the last _get_quotes()
+        self.instrumentation = None # Instrumentation of the last get_stats(), see instrument.py
         if loaddata:
             self.sym.get_quotes()
             self.load_data(from_file=True)
@@ -25,6 +38,16 @@ class Index(object):
         """
         return self.components
 
+    def _get_benchmark(self):
+        """
+        The Benchmark of the index quotes shared by all components, created once.
+        Its normalized EMA series are precomputed, so they are pickled into the worker processes.
+        """
+        if self.benchmark == None:
+            self.benchmark = Benchmark(self.sym)
+            self.benchmark.precompute()
+        return self.benchmark
+
     # Helper function for parallel-computing
     def _get_single_compo_stat(self, args):
         sym = args[0]
@@ -35,7 +58,7 @@ class Index(object):
         stock = Symbol(sym, datapath=self.datapath+'/../', loaddata=False)
         stock.quotes = quote
         if not stock.quotes.empty:
-            stock.get_stats(index=self.sym, exclude_name=True, exclude_dividend=True)
+            stock.get_stats(index=self._get_benchmark(), exclude_name=True, exclude_dividend=True)
             stat = stock.stats
         else:
             print('Appending empty stats for ' + sym)
@@ -44,85 +67,247 @@ class Index(object):
 
     def _get_compo_stats(self, pquotes):
         """
-        pquotes: Pandas Panel of stocks' quotes from DataReader.
+        pquotes: Pandas Panel of stocks' quotes from DataReader, or a dict of <symbol:DataFrame>.
         """
         # calc additional stats
-        add_stats = DataFrame()
-        num_cores = mp.cpu_count()
-        pool = ThreadPool(num_cores)
-        args = [] # a list of 2-tuples
-        for sym in pquotes.items:
-            args.append( (sym, pquotes[sym]) )
-        stats = pool.map(self._get_single_compo_stat, args)
-        for s in stats:
-            add_stats = add_stats.append(s)
-        return add_stats
-
-    def _get_chunk_stats(self, args):
-        """
-        Internal function to process stocks in batch.
-        """
-        iStart = args[0]
-        iEnd = args[1]
-        [start_date, end_date] = parse_start_end_date(None, None)
-        print('Chunk %d - %d' %(iStart, iEnd)) # FIXME: TEST ONLY
-        chunk_stats = self.components[iStart:iEnd]
-        sym_list = self.components[iStart:iEnd].index.tolist()
-        pquotes = web.DataReader(sym_list, "yahoo", start_date, end_date)
-        # items - symbols; major_axis - time; minor_axis - Open to Adj Close
-        pquotes = pquotes.transpose(2,1,0)
-        if len(pquotes.items) == 0:
-            print('Error: failed to get history quotes for chunk  %d - %d.' %(iStart, iEnd))
+        self._get_benchmark()
+        stats = [self._get_single_compo_stat((sym, pquotes[sym])) for sym in pquotes.keys()]
+        stats = [s for s in stats if not s.empty]
+        if len(stats) == 0:
             return DataFrame()
-        print('Total # of symbols in this chunk: %d' %len(pquotes.items)) # FIXME: TEST ONLY
-        add_stats = self._get_compo_stats(pquotes)
-        chunk_stats = chunk_stats.join(add_stats)
-        return chunk_stats
+        return pd.concat(stats)
 
-    def get_stats(self, save=True, chunk=256):
+    def _get_compo_stats_matrix(self, pquotes):
         """
-        Calculate all components' statistics in batch.
+        Same as _get_compo_stats(), but the quotes of all symbols are aligned into
+        dates x symbols arrays and the stats are computed on the whole arrays.
+
+        pquotes: Pandas Panel of stocks' quotes from DataReader, or a dict of <symbol:DataFrame>.
+        """
+        with instrument.stage('align'):
+            qm = QuoteMatrix(pquotes)
+        if len(qm) == 0:
+            return DataFrame()
+        with instrument.stage('fundamentals'):
+            stats = get_fundamentals(qm.symbols, exclude_name=True, cachefile=self.sym.files['fundamentals'])
+        with instrument.stage('return'):
+            stats = stats.join(qm.return_stats())
+        if not self.sym.quotes.empty:
+            with instrument.stage('diverge'):
+                stats = stats.join(qm.diverge_stats(self._get_benchmark()))
+        with instrument.stage('trend'):
+            stats = stats.join(qm.trend_stats())
+        # financial statements are files of each symbol
+        with instrument.stage('financial'):
+            fin_stats = list()
+            for sym in qm.symbols:
+                stock = Symbol(sym, datapath=self.datapath+'/../', loaddata=False)
+                fin_stats.append(stock.financial_stats(exchange=stats['Exchange'][sym]))
+            fin_stats = [s for s in fin_stats if not s.empty]
+            if len(fin_stats) > 0:
+                stats = stats.join(pd.concat(fin_stats))
+        with instrument.stage('additional'):
+            stats = stats.join(qm.additional_stats(stats))
+        return stats
+
+    def _get_chunk_quotes(self, sym_list, start_date, end_date):
+        """
+        Get history quotes of a chunk of components, incrementally.
+
+        Stored quotes are only extended by the bars after their last date, and the
+        full history is downloaded for symbols not stored yet or restated.
+        Return a dict of <symbol:DataFrame>.
+        """
+        self.quote_errors = dict()
+        quotes = self.load_compo_quotes(sym_list)
+        stale = [sym for sym in quotes if quotes[sym].last_valid_index().date() < end_date]
+        full = [sym for sym in sym_list if sym not in quotes]
+        if len(stale) > 0:
+            # the tail of each symbol from its own last date, a long stale one doesn't extend the others
+            tail_starts = {sym: quotes[sym].last_valid_index().date() for sym in stale}
+            tails = download_quotes(stale, tail_starts, end_date, self.downloader)
+            self.quote_errors.update(self.downloader.errors)
+            for sym in stale:
+                [merged, restated] = merge_quotes(quotes[sym], tails.get(sym))
+                if restated:
+                    full.append(sym)
+                    del quotes[sym]
+                elif len(merged) > len(quotes[sym]):
+                    quotes[sym] = merged
+                    save_quotes(merged, self._compo_store(sym))
+        if len(full) > 0:
+            history = download_quotes(full, start_date, end_date, self.downloader)
+            self.quote_errors.update(self.downloader.errors)
+            for sym in history:
+                quotes[sym] = history[sym]
+                save_quotes(history[sym], self._compo_store(sym))
+        return quotes
+
+    def _get_quotes(self, sym_list):
+        """
+        Get history quotes of components, the downloads run concurrently in self.downloader.
+        Return a dict of <symbol:DataFrame>.
         """
         [start_date, end_date] = parse_start_end_date(None, None)
-        self.components = DataFrame() # reset data
-        self.get_compo_list()
-        if self.sym.quotes.empty:
-            self.sym.get_quotes()
+        return self._get_chunk_quotes(sym_list, start_date, end_date)
+
+    def _checkpoint_dir(self):
+        # checkpoints of get_stats() are only valid on the same day
+        return os.path.normpath(self.datapath + '/checkpoints/' + dt.date.today().strftime('%Y-%m-%d'))
+
+    def _get_checkpointed_stats(self, sym_list, executor, func, size):
+        """
+        Calculate the stats of sym_list in chunks of size symbols. The quotes are downloaded per
+        chunk, and the stats of each chunk are saved to a checkpoint file as soon as it is done,
+        so a rerun on the same day skips the finished chunks. A chunk missing the quotes of some
+        symbols, e.g. by failed downloads, is not saved, so the rerun does it again. Unknown
+        symbols (HTTP 404) don't count as missing.
+        Return a list of the stats DataFrames of the chunks.
+        """
+        path = self._checkpoint_dir()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        results = list()
+        for i in range(0, len(sym_list), size):
+            chunk = sym_list[i:i+size]
+            f = os.path.join(path, 'stats_%s.pkl' %hashlib.md5(' '.join(chunk).encode('utf-8')).hexdigest())
+            if os.path.isfile(f):
+                print('Skipped %d symbols done by the previous run.' %len(chunk))
+                results.append(pd.read_pickle(f))
+                continue
+            with instrument.stage('quotes'):
+                pquotes = self._get_quotes(chunk)
+            with instrument.stage('stats'):
+                stats = self._map_stats(executor, func, pquotes) if len(pquotes) > 0 else []
+            stats = [s for s in stats if not s.empty]
+            stats = pd.concat(stats) if len(stats) > 0 else DataFrame()
+            results.append(stats)
+            missing = [sym for sym in chunk if (sym not in pquotes or sym in self.quote_errors) and self.quote_errors.get(sym) != 'HTTP 404']
+            if len(missing) > 0:
+                print('Error: not checkpointed %d symbols, missing the quotes of %s.' %(len(chunk), ', '.join(missing)))
+            else:
+                stats.to_pickle(f + '.tmp')
+                os.replace(f + '.tmp', f) # a chunk is either done or not
+            print('Processed %d of %d symbols.' %(min(i + size, len(sym_list)), len(sym_list)))
+        return results
 
-        if len(self.components) <= chunk:
-            args = (0,len(self.components))
-            self.components = self._get_chunk_stats(args)
-            return self.components
+    def _run_chunk(self, func, pquotes):
+        """
+        Run func(pquotes) on a chunk of components, e.g. in a worker process. If get_stats() is
+        instrumented, the chunk is recorded into a new Instrumentation, merged by _map_stats().
+        Return: [result, record of the Instrumentation or None]
+        """
+        if self.instrumentation == None:
+            return [func(pquotes), None]
+        syms = list(pquotes.keys())
+        inst = Instrumentation(profile=self.instrumentation.profile, hook=self.instrumentation.hook)
+        with inst.activate():
+            with inst.stage('chunk', chunk='%s..%s' %(syms[0], syms[-1]) if len(syms) > 0 else ''):
+                result = func(pquotes)
+        return [result, inst.record()]
+
+    def _map_stats(self, executor, func, pquotes):
+        """
+        Calculate the stats of pquotes chunk-by-chunk in the executor, see _run_chunk().
+        Return a list of the stats DataFrames of the chunks.
+        """
+        results = executor.map(func, pquotes, context=self)
+        if self.instrumentation != None:
+            for [stats, record] in results:
+                self.instrumentation.merge(record)
+        return [stats for [stats, record] in results]
 
-        # multiprocessing - process stocks chunk-by-chunk
-        num_chunks = int(np.ceil(len(self.components)/chunk))
-        num_procs = min(mp.cpu_count(), num_chunks)
-        pool = mp.Pool(processes=num_procs)
-        steps = np.round(np.linspace(0, len(self.components), num_chunks)).astype(int)
-        args = [(steps[i-1], steps[i]) for i in range(1,len(steps))]
-        stats = pool.map(self._get_chunk_stats, args)
+    def get_stats(self, save=True, chunk=None, matrix=False, workers=None, checkpoint=None, instrumentation=None):
+        """
+        Calculate all components' statistics in batch.
 
-        chunk_stats = DataFrame()
-        for s in stats:
-            chunk_stats = chunk_stats.append(s)
-        self.components = chunk_stats
+        chunk: number of symbols per task of the worker processes, see ComponentExecutor
+        matrix: compute the stats of each chunk on aligned dates x symbols arrays, see QuoteMatrix
+        workers: number of worker processes, default to the number of CPUs
+        checkpoint: number of symbols per checkpoint, e.g. 500. The symbols are processed in chunks
+                    of this size and each finished chunk is saved under datapath/checkpoints, so a
+                    failed run can be resumed on the same day. None to process all symbols at once.
+        instrumentation: True or an Instrumentation to record the wall time of the stages, per
+                    symbol and per chunk, and counters like the bytes downloaded and the cache hits.
+                    Its report is printed, and saved to datapath/instrumentation.json if save.
+        """
+        if instrumentation == True:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation or None
+        if self.instrumentation == None:
+            return self._get_stats(save, chunk, matrix, workers, checkpoint)
+        with self.instrumentation.activate():
+            with instrument.stage('get_stats'):
+                self._get_stats(save, chunk, matrix, workers, checkpoint)
+        print(self.instrumentation.report())
+        if save:
+            if not os.path.isdir(self.datapath):
+                os.makedirs(self.datapath)
+            self.instrumentation.dump(self.datapath + '/instrumentation.json')
+        return self.components
 
-        # Replace inf by NaN
-        self.components.replace([np.inf, -np.inf], np.nan, inplace=True)
+    def _get_stats(self, save, chunk, matrix, workers, checkpoint):
+        # see get_stats()
+        self.components = DataFrame() # reset data
+        with instrument.stage('compo_list'):
+            self.get_compo_list()
+        with instrument.stage('benchmark'):
+            if self.sym.quotes.empty:
+                self.sym.update_quotes()
+            self.benchmark = None # quotes may have been updated
+            self._get_benchmark()
+
+        sym_list = self.components.index.tolist()
+        # fundamentals of all components in batches, the workers read them from the cache
+        with instrument.stage('fundamentals_prefetch'):
+            get_fundamentals(sym_list, exclude_name=True, cachefile=self.sym.files['fundamentals'])
+
+        # multiprocessing - process stocks chunk-by-chunk, the quotes are shared with the workers
+        executor = ComponentExecutor(workers=workers, chunksize=chunk)
+        func = _compo_stats_matrix if matrix else _compo_stats
+        if checkpoint != None:
+            stats = self._get_checkpointed_stats(sym_list, executor, func, checkpoint)
+        else:
+            with instrument.stage('quotes'):
+                pquotes = self._get_quotes(sym_list)
+            if len(pquotes) == 0:
+                print('Error: failed to get history quotes for %s.' %self.name)
+                return self.components
+            print('Total # of symbols: %d' %len(pquotes)) # FIXME: TEST ONLY
+            with instrument.stage('stats'):
+                stats = self._map_stats(executor, func, pquotes)
+        with instrument.stage('join'):
+            stats = [s for s in stats if not s.empty]
+            if len(stats) > 0:
+                self.components = self.components.join(pd.concat(stats))
+
+            # Replace inf by NaN
+            self.components.replace([np.inf, -np.inf], np.nan, inplace=True)
 
         if save and not self.components.empty:
-            self.save_data()
+            with instrument.stage('save'):
+                self.save_data()
+        if checkpoint != None:
+            shutil.rmtree(os.path.normpath(self.datapath + '/checkpoints'), ignore_errors=True) # done
         return self.components
 
-    def get_financials(self):
+    def get_financials(self, browser=False, workers=None):
         """
         Download financial data for all stocks.
+
+        browser: drive a browser (selenium) through the statements of each stock, otherwise
+                 capture the statement pages concurrently and parse them in worker processes
+        workers: number of worker processes for parsing
         """
         if self.components.empty:
             self.get_compo_list()
         exch = None
         if self.name == 'NASDAQ':
             exch = 'NASDAQ'
+        if not browser:
+            self.capture_financials(exchange=exch)
+            self.parse_financials(workers=workers)
+            return
         browser=webdriver.Chrome()
         for sym in self.components.index:
             print('Downloading financial data for ' + sym) # FIXME: TEST ONLY
@@ -132,6 +317,41 @@ class Index(object):
         browser.close()
         return
 
+    def capture_financials(self, exchange=None, threads=16):
+        """
+        Download and save the statement pages of all components, see Symbol.capture_financials().
+        """
+        if self.components.empty:
+            self.get_compo_list()
+        stocks = [Symbol(sym, datapath=self.datapath+'/../', loaddata=False) for sym in self.components.index]
+        if exchange == None:
+            # the exchange of each stock from the fundamentals, e.g. the NASDAQ-listed members of SP500
+            stats = get_fundamentals(self.components.index.tolist(), exclude_name=True, cachefile=self.sym.files['fundamentals'])
+            if 'Exchange' in stats.columns:
+                for stock in stocks:
+                    stock.exch = stats['Exchange'].get(stock.sym)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            saved = list(pool.map(lambda stock: stock.capture_financials(exchange=exchange), stocks))
+        print('Captured statement pages of %d of %d stocks.' %(sum(saved), len(stocks)))
+
+    def parse_financials(self, workers=None, chunksize=16):
+        """
+        Parse the saved statement pages of all components in worker processes,
+        and save the statements of each stock.
+        """
+        if self.components.empty:
+            self.get_compo_list()
+        args = [(sym, self.datapath+'/../') for sym in self.components.index]
+        if len(args) == 0:
+            return
+        pool = mp.Pool(processes=workers)
+        try:
+            parsed = pool.map(_parse_financials, args, chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
+        print('Parsed statements of %d of %d stocks.' %(sum(parsed), len(args)))
+
     def get_sector(self, sector):
         """
         Filter out all components in the same sector.
@@ -146,41 +366,48 @@ class Index(object):
         symbols = self.components.where(m, np.nan)
         return symbols.dropna(axis=0, how='all') # drop all NaN rows
 
-    def sector_top(self, percent=0.5, saveto=None):
+    def sector_top(self, percent=0.5, saveto=None, by='Sector'):
         """
         Calculate the sector top performance of each column.
 
-        percent: percentage of top, [0-1]
+        percent: percentage of top, [0-1], or a list of them
         saveto: save to file
+        by: 'Sector', or 'Industry' for the industry top performance
+        Return: DataFrame indexed by sector, or by [sector, 'Percent'] for a list of percentages.
         """
         if self.components.empty:
             self.get_stats()
+        percents = percent if type(percent) == list else [percent]
+        comps = self.components[self.components[by].notnull()]
+        [codes, groups] = pd.factorize(comps[by]) # in the order of appearance
+        numeric = [col for col in comps.columns if col != by and pd.api.types.is_numeric_dtype(comps[col])]
+        cuts = group_percentiles(comps[numeric].values.astype(float), codes, len(groups), percents)
+
         tops = list()
-        all_sectors = self.components['Sector'].drop_duplicates()
-        for sec in all_sectors:
-            symbols = self.get_sector(sec)
-            if symbols.empty:
-                continue
-            row = list()
-            for col in symbols.columns:
-                if col == 'Name' or col == 'Industry':
-                    column = symbols['1YearReturn'].dropna() # this is a trick
+        for p, cut in zip(percents, cuts):
+            cut = DataFrame(cut, index=groups, columns=numeric)
+            top = DataFrame(index=groups, columns=self.components.columns)
+            for col in self.components.columns:
+                if col == by:
+                    top[col] = groups
+                elif col == 'Name' or col == 'Industry':
+                    top[col] = cut['1YearReturn'] if '1YearReturn' in numeric else np.nan # this is a trick
                 elif col == 'Sector':
-                    row.append(sec)
-                    continue
+                    top[col] = comps.groupby(codes)[col].first().values # sector of the industry
+                elif col in numeric:
+                    top[col] = cut[col]
                 else:
-                    column = symbols[col].dropna()
-                if column.empty:
-                    row.append(np.nan)
-                    continue
-                idx = int(np.floor(len(column) * percent)) # sort ascendingly
-                if idx == len(column):
-                    idx = -1 # last element
-                row.append(column.sort_values(ascending=True)[idx])
-            tops.append(row) # each sector
-
-        tops_df = DataFrame(tops, columns=self.components.columns)
-        tops_df = tops_df.set_index('Sector')
+                    # not numbers, e.g. dates, sorted per group
+                    top[col] = comps.groupby(codes)[col].apply(lambda c: _percentile_value(c.dropna().sort_values(ascending=True), p)).values
+            if len(percents) > 1:
+                top['Percent'] = p
+            tops.append(top)
+
+        if len(percents) > 1:
+            tops_df = pd.concat(tops).set_index([by, 'Percent'])
+            tops_df = tops_df.reindex(pd.MultiIndex.from_product([groups, percents], names=[by, 'Percent']))
+        else:
+            tops_df = tops[0].set_index(by)
         if saveto != None and not tops_df.empty:
             f = os.path.normpath(self.datapath + '/' + saveto)
             tops_df.to_csv(f)
@@ -207,13 +434,18 @@ class Index(object):
             return
         return self.components.loc[stocks, columns].transpose()
 
-    def filter(self, columns, n=-1, saveto=None):
+    def filter(self, columns, n=-1, saveto=None, mode='common'):
         """
         Find out the common top n components according to the given columns(str, list or dict).
 
         n: number of the top components for each columns
         columns: str, list or dict. By default all given columns will be sorted by descending order.
                  To specify different orders for different columns, a dict can be used.
+        mode: how the top n of multiple columns are combined:
+              'common' - the components in the top n of all columns, sorted by symbol
+              'union'  - the components in the top n of any column, ranked by the number of
+                         columns they are in, then by their average rank in those columns
+              'score'  - the top n components by the average percentile rank of all columns
         For example:
             cheap={'Avg Quarterly Return':False, 'Last-Quarter Return':True, 'Price In 52-week Range':True}
             reliable={'Median Quarterly Return':False, 'Avg Quarterly Return':False, 'Median Yearly Return':False, 'Avg Yearly Return':False, 'Yearly Diverge Index':False}
@@ -236,25 +468,41 @@ class Index(object):
         else:
             print('Error: unsupported columns type.')
             return None
+        if mode not in ['common', 'union', 'score']:
+            print('Error: unsupported mode %s.' %mode)
+            return None
         if len(cols) == 0:
             return None
         elif len(cols) == 1:
-            return self.components.sort_values(cols[0], ascending=orders[0])[:n] # slicing
-
-        # multiple columns
-        comp = self.components.sort_values(cols[0], ascending=orders[0])
-        common = comp.index[:n]
-        for col,order in zip(cols[1:], orders[1:]):
-            comp = self.components.sort_values(col, ascending=order)
-            common = common.append(comp.index[:n])
-            common_list = common.get_duplicates()
-            if len(common_list) < 1:
-                return None # Nothing in common
-            common = pd.indexes.base.Index(common_list)
-        if saveto != None and len(common) > 0:
+            return self.components.iloc[top_positions(self.components[cols[0]], n, orders[0])]
+
+        # multiple columns, on integer positions of the components
+        if mode == 'common':
+            common = top_positions(self.components[cols[0]], n, orders[0])
+            for col,order in zip(cols[1:], orders[1:]):
+                common = np.intersect1d(common, top_positions(self.components[col], n, order))
+                if len(common) < 1:
+                    return None # Nothing in common
+            selected = self.components.iloc[common].sort_index()
+        elif mode == 'union':
+            hits = np.zeros(len(self.components), dtype=int)
+            ranks = np.zeros(len(self.components))
+            for col,order in zip(cols, orders):
+                top = top_positions(self.components[col], n, order)
+                hits[top] += 1
+                ranks[top] += np.arange(len(top))
+            union = np.nonzero(hits)[0]
+            ranks = ranks[union] / hits[union]
+            selected = self.components.iloc[union[np.lexsort((union, ranks, -hits[union]))]]
+        else:
+            # percentile ranks, the smaller the better, NaN at the bottom
+            ranks = DataFrame({col: self.components[col] if order else -self.components[col] for col,order in zip(cols, orders)})
+            scores = ranks.rank(pct=True, na_option='bottom').mean(axis=1)
+            selected = self.components.iloc[top_positions(scores, n, ascending=True)]
+        if saveto != None and len(selected) > 0:
             f = os.path.normpath(self.datapath + '/' + saveto)
-            self.components.loc[common].to_csv(f)
-        return self.components.loc[common] # DataFrame of common stocks
+            selected.to_csv(f)
+        return selected # DataFrame of the selected stocks
 
     def load_data(self, from_file=True):
         if from_file:
@@ -267,6 +515,27 @@ class Index(object):
             self.get_stats()
         return self.components
 
+    def load_compo_quotes(self, symbols=None):
+        """
+        Load components' history quotes from the binary quote store, see store.py.
+        The quotes are memory-mapped, so nothing is parsed or copied at load time.
+
+        symbols: a list of tickers, by default all components
+        Return a dict of <symbol:DataFrame>, symbols without stored quotes are skipped.
+        """
+        if symbols == None:
+            symbols = self.components.index.tolist()
+        quotes = dict()
+        for sym in symbols:
+            prefix = self._compo_store(sym)
+            if has_quotes(prefix):
+                quotes[sym] = load_quotes(prefix)
+        return quotes
+
+    def _compo_store(self, sym):
+        # components share the data directory of Symbol(sym), e.g. ./data/AAPL/quotes
+        return os.path.normpath(self.datapath + '/../' + sym + '/quotes')
+
     def save_data(self):
         if not os.path.isdir(self.datapath):
             os.makedirs(self.datapath)
@@ -275,12 +544,107 @@ class Index(object):
             self.components.to_csv(self.datafile)
         return
 
-def ranking(stocks):
+def _parse_financials(args):
+    # task of Index.parse_financials()
+    [sym, datapath] = args
+    stock = Symbol(sym, datapath=datapath, loaddata=False)
+    stock.parse_financials()
+    if stock.income.empty and stock.balance.empty and stock.cashflow.empty:
+        return False
+    stock.save_financial_data()
+    return True
+
+# Tasks of ComponentExecutor, module-level so they can be sent to worker processes
+def _compo_stats(index, pquotes):
+    return index._run_chunk(index._get_compo_stats, pquotes)
+
+def _compo_stats_matrix(index, pquotes):
+    return index._run_chunk(index._get_compo_stats_matrix, pquotes)
+
+def download_quotes(symbols, start_date, end_date, downloader=None):
+    """
+    Download history quotes of multiple symbols from Yahoo Finance, concurrently.
+
+    start_date: datetime.date, or a dict of <symbol:date>
+    downloader: QuoteDownloader, e.g. with a different base_url or concurrency
+    Return a dict of <symbol:DataFrame>, symbols without quotes are skipped.
+    """
+    if downloader == None:
+        downloader = QuoteDownloader()
+    return downloader.download(symbols, start_date, end_date)
+
+def top_positions(values, n, ascending=False):
+    """
+    Integer positions of the top n values in order, like sort_values(ascending=ascending)[:n]
+    with NaN last, by partial selection in O(len(values) + n*log(n)) instead of a full sort.
+    Ties are kept in the order of positions.
+
+    values: Series or array-like numbers
+    """
+    if type(values) == pd.Series and not pd.api.types.is_numeric_dtype(values):
+        return values.reset_index(drop=True).sort_values(ascending=ascending, kind='mergesort').index[:n].values # e.g. names
+    key = np.array(values, dtype=float)
+    if not ascending:
+        key = -key
+    valid = np.nonzero(~np.isnan(key))[0]
+    if len(valid) <= n:
+        top = valid
+        rest = np.nonzero(np.isnan(key))[0][:n - len(valid)]
+    else:
+        k = key[valid]
+        kth = np.partition(k, n - 1)[n - 1]
+        below = valid[k < kth]
+        top = np.concatenate([below, valid[k == kth][:n - len(below)]])
+        rest = np.array([], dtype=int)
+    top = top[np.lexsort((top, key[top]))] # by value, then by position
+    return np.concatenate([top, rest])
+
+def _percentile_value(column, percent):
+    # the element at floor(len * percent) of the sorted column, NaN if empty
+    if column.empty:
+        return np.nan
+    idx = min(int(np.floor(len(column) * percent)), len(column) - 1)
+    return column.iloc[idx]
+
+def group_percentiles(values, codes, ngroups, percents):
+    """
+    The percentile cut-offs of every column within every group, by two sorts of the whole
+    array instead of sorting every column of every group.
+
+    values: 2-D array of rows x columns, NaN values are skipped
+    codes: group of each row, in [0, ngroups)
+    percents: list of percentages in [0-1]
+    Return: an array of percents x groups x columns. The cut-off of a percentage is the element
+    at floor(count * percent) of the sorted values, or the last one.
+    """
+    [rows, cols] = values.shape
+    # rank within the column, NaN last, then sort by (group, rank)
+    order = np.argsort(values, axis=0, kind='stable')
+    rank = np.empty(values.shape, dtype=np.int64)
+    np.put_along_axis(rank, order, np.arange(rows).reshape(-1, 1), axis=0)
+    order = np.argsort(codes.reshape(-1, 1) * rows + rank, axis=0)
+    sorted_values = np.take_along_axis(values, order, axis=0)
+
+    counts = np.zeros((ngroups, cols))
+    np.add.at(counts, codes, ~np.isnan(values))
+    sizes = np.bincount(codes, minlength=ngroups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int)
+    cuts = np.full((len(percents), ngroups, cols), np.nan)
+    for i, p in enumerate(percents):
+        k = np.minimum(np.floor(counts * p), counts - 1).clip(min=0).astype(int)
+        cut = sorted_values[starts.reshape(-1, 1) + k, np.arange(cols)]
+        cuts[i] = np.where(counts > 0, cut, np.nan)
+    return cuts
+
+def ranking(stocks, factors=None, weights=None):
     """
     Make a table and compare stocks based on key factors.
     For each column, the stocks are given a score between [0 - 10], and the total scores are computed for each column.
 
     stocks: Pandas DataFrame of stock stats or Index
+    factors: dict of <column:True if the larger the better>, default to scoring.RANKING_FACTORS
+    weights: dict of <column:weight> of the scores in the total, default to 1
+    Use a scoring.Scorer to re-score only the changed stocks on every refresh.
     """
     if type(stocks) == pd.DataFrame:
         symbols = stocks
@@ -288,28 +652,7 @@ def ranking(stocks):
         print('Error: ranking: unsupported type %s' %type(stocks))
         return DataFrame()
 
-    # True - the larger the better, False - the smaller the better
-    tags = {'MedianQuarterlyReturn':True, 'AvgQuarterlyReturn':True, 'RevenueMomentum':True, 'ProfitMarginMomentum':True, 'EPSGrowth':True, 'PEG':False, 'Forward P/E':False} #, 'PriceIn52weekRange':False}
-    table = DataFrame()
-    for t in tags.keys():
-        maxrange = symbols[t].max() - symbols[t].min()
-        symbols[t].replace(np.nan, maxrange/2, inplace=True) # replace NaN with mean
-        if tags[t]:
-            # the larger the better
-            col = np.round((symbols[t] - symbols[t].min()) / maxrange * 10)
-        else:
-            # the smaller the better
-            col = np.round((symbols[t].max() - symbols[t]) / maxrange * 10)
-        if table.empty:
-            table = table.append(col).transpose()
-        else:
-            table = table.join(col)
-
-    total = pd.Series(table.transpose().sum(), name='Total', index=table.index)
-    table = table.join(total)
-    table.sort_values('Total', ascending=False, inplace=True)
-
-    return table
+    return Scorer(factors, weights).score(symbols)
 
 
 def get_index_components_from_wiki(link, params):
@@ -325,7 +668,7 @@ def get_index_components_from_wiki(link, params):
     """
     tags = ['Symbol', 'Name', 'Sector', 'Industry']
     page = urlopen(link)
-    soup = BeautifulSoup(page, 'html.parser')
+    soup = bs4.BeautifulSoup(page, 'html.parser')
     table = soup.find('table', {'class': 'wikitable sortable'})
     st = list()
     for row in table.find_all('tr'):
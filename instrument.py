@@ -0,0 +1,236 @@
+import io
+import time
+import json
+import pstats
+import cProfile
+import threading
+import contextlib
+
+#
+# Instrumentation of Symbol.get_stats() and Index.get_stats().
+#
+# The code marks its stages with stage() and its events with count(). Both do nothing unless an
+# Instrumentation is active in the process, so they can stay in the hot paths. The worker
+# processes of Index.get_stats() record each chunk into a new Instrumentation, which is sent
+# back with the results of the chunk and merged into the one of the run, see Index._run_chunk().
+# Only these chunk-level records are aggregated: the workers start with no active Instrumentation,
+# so the stages and counts of a worker outside its chunks aren't recorded.
+#
+# Example:
+#   inst = Instrumentation()
+#   with inst.activate():
+#       Symbol('AAPL').get_stats()
+#   print(inst.report())
+#
+
+_active = None # the active Instrumentation of this process
+
+class Instrumentation(object):
+    """
+    Wall time and calls of stages, per symbol and per chunk, and counters of events.
+    """
+    def __init__(self, profile=False, hook=None):
+        """
+        profile: run cProfile within the stages of chunks, see profile_stats()
+        hook: function hook(stage, key, seconds) called when a stage ends, e.g. to sample the
+              memory usage; it must be picklable, i.e. a module-level function, to be called in
+              the worker processes
+        """
+        self.profile = profile
+        self.hook = hook
+        self.stages = dict()   # <stage:[calls, seconds, max seconds]>
+        self.symbols = dict()  # <symbol:<stage:seconds>>
+        self.chunks = dict()   # <chunk:<stage:seconds>>
+        self.counters = dict() # <name:value>
+        self.started = time.time()
+        self._profile_stats = dict() # stats of pstats.Stats
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # locks can't be pickled, e.g. when an Index is sent to a worker process
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Make this the active Instrumentation of the process within the context.
+        """
+        global _active
+        previous = _active
+        _active = self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    @contextlib.contextmanager
+    def stage(self, name, sym=None, chunk=None):
+        """
+        Time a stage, of a symbol or a chunk of symbols if given.
+        """
+        profiler = None
+        if self.profile and chunk != None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t
+            if profiler != None:
+                profiler.disable()
+                profiler.create_stats()
+                self._add_profile(profiler.stats)
+            with self._lock:
+                stat = self.stages.setdefault(name, [0, 0.0, 0.0])
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = max(stat[2], seconds)
+                if sym != None:
+                    stages = self.symbols.setdefault(sym, dict())
+                    stages[name] = stages.get(name, 0.0) + seconds
+                if chunk != None:
+                    stages = self.chunks.setdefault(chunk, dict())
+                    stages[name] = stages.get(name, 0.0) + seconds
+            if self.hook != None:
+                self.hook(name, sym if sym != None else chunk, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _add_profile(self, stats):
+        # stats: <function:(primitive calls, calls, total time, cumulative time, callers)>
+        if len(stats) == 0:
+            return
+        with self._lock:
+            if len(self._profile_stats) == 0:
+                self._profile_stats = dict(stats)
+                return
+            total = pstats.Stats(_ProfileStats(self._profile_stats))
+            total.add(_ProfileStats(dict(stats)))
+            self._profile_stats = total.stats
+
+    def record(self):
+        """
+        Everything recorded, picklable, see merge().
+        """
+        with self._lock:
+            return {'stages': {k: list(v) for k, v in self.stages.items()},
+                    'symbols': {k: dict(v) for k, v in self.symbols.items()},
+                    'chunks': {k: dict(v) for k, v in self.chunks.items()},
+                    'counters': dict(self.counters),
+                    'profile': dict(self._profile_stats)}
+
+    def merge(self, record):
+        """
+        Add a record() of another Instrumentation, e.g. of a chunk in a worker process.
+        """
+        with self._lock:
+            for name, [calls, seconds, longest] in record['stages'].items():
+                stat = self.stages.setdefault(name, [0, 0.0, 0.0])
+                stat[0] += calls
+                stat[1] += seconds
+                stat[2] = max(stat[2], longest)
+            for table, records in [(self.symbols, record['symbols']), (self.chunks, record['chunks'])]:
+                for key, stages in records.items():
+                    mine = table.setdefault(key, dict())
+                    for name, seconds in stages.items():
+                        mine[name] = mine.get(name, 0.0) + seconds
+            for name, n in record['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            if len(record['profile']) > 0:
+                self._add_profile(record['profile'])
+
+    def profile_stats(self):
+        """
+        pstats.Stats of the profiled stages, None if not profiled.
+        """
+        if len(self._profile_stats) == 0:
+            return None
+        return pstats.Stats(_ProfileStats(dict(self._profile_stats)))
+
+    def to_dict(self):
+        """
+        Everything recorded except the profile, for JSON.
+        """
+        record = self.record()
+        del record['profile']
+        record['stages'] = {k: {'calls': v[0], 'seconds': v[1], 'max_seconds': v[2]} for k, v in record['stages'].items()}
+        record['wall_seconds'] = time.time() - self.started
+        return record
+
+    def dump(self, filename):
+        """
+        Save to_dict() as JSON.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self, top=10):
+        """
+        Summary of the stages, counters and the slowest symbols and chunks.
+        """
+        lines = list()
+        with self._lock:
+            wall = time.time() - self.started
+            lines.append('Instrumentation, %.1f seconds:' %wall)
+            lines.append('  %-24s %8s %12s %12s %12s' %('stage', 'calls', 'total(s)', 'mean(s)', 'max(s)'))
+            for name, [calls, seconds, longest] in sorted(self.stages.items(), key=lambda x: -x[1][1]):
+                lines.append('  %-24s %8d %12.3f %12.4f %12.4f' %(name, calls, seconds, seconds / max(calls, 1), longest))
+            if len(self.counters) > 0:
+                lines.append('  %-24s %12s' %('counter', 'value'))
+                for name, n in sorted(self.counters.items()):
+                    lines.append('  %-24s %12d' %(name, n))
+            for title, table in [('symbols', self.symbols), ('chunks', self.chunks)]:
+                if len(table) == 0:
+                    continue
+                slowest = sorted(table.items(), key=lambda x: -sum(x[1].values()))[:top]
+                lines.append('  slowest %d of %d %s:' %(len(slowest), len(table), title))
+                for key, stages in slowest:
+                    detail = ', '.join('%s %.3f' %(name, s) for name, s in sorted(stages.items(), key=lambda x: -x[1]))
+                    lines.append('    %-22s %8.3f  (%s)' %(key, sum(stages.values()), detail))
+        stats = self.profile_stats()
+        if stats != None:
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(top)
+            lines.append(out.getvalue())
+        return '\n'.join(lines)
+
+class _ProfileStats(object):
+    # pstats.Stats loads the stats of any object with create_stats() and stats
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+_null_stage = contextlib.nullcontext()
+
+def active():
+    """
+    The active Instrumentation of the process, or None.
+    """
+    return _active
+
+def stage(name, sym=None, chunk=None):
+    """
+    Time a stage with the active Instrumentation, if any.
+    """
+    if _active == None:
+        return _null_stage
+    return _active.stage(name, sym, chunk)
+
+def count(name, n=1):
+    """
+    Count an event with the active Instrumentation, if any.
+    """
+    if _active != None:
+        _active.count(name, n)
@@ -0,0 +1,46 @@
+import sys
+import types
+import importlib
+
+#
+# Lazily imported modules.
+#
+# Plotting, scraping and remote data modules take most of the import time of the package, e.g.
+# matplotlib.pyplot and selenium, but number crunching on local data never uses them. A
+# LazyModule stands in for such a module and imports it on the first access of an attribute,
+# so the package and the worker processes start without them.
+#
+
+class LazyModule(types.ModuleType):
+    """
+    A module imported on the first access of its attributes, e.g.
+        plt = LazyModule('matplotlib.pyplot')
+        plt.plot(x)  # matplotlib.pyplot is imported here
+    """
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module == None:
+            module = importlib.import_module(self.__name__) # thread-safe, by the import lock
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        # only called for attributes not set on the proxy itself
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded() else 'not loaded'
+        return '<lazy module %r (%s)>' %(self.__name__, state)
+
+    def is_loaded(self):
+        """
+        True if the module is imported, by this proxy or elsewhere.
+        """
+        return self.__dict__['_module'] != None or self.__name__ in sys.modules
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+#
+# Cross-sectional scoring of stocks, see ranking().
+#
+# Every factor column is scaled to a score in [0 - 10] between its min and max over all stocks,
+# and the total is the weighted sum of the scores. All factors are scored as one array operation,
+# and update() re-scores only the stocks whose factors changed since the last call.
+#
+
+# True - the larger the better, False - the smaller the better
+RANKING_FACTORS = {'MedianQuarterlyReturn':True, 'AvgQuarterlyReturn':True, 'RevenueMomentum':True, 'ProfitMarginMomentum':True, 'EPSGrowth':True, 'PEG':False, 'Forward P/E':False} #, 'PriceIn52weekRange':False}
+
+class Scorer(object):
+    """
+    Score stocks by factor columns of their stats.
+    """
+    def __init__(self, factors=None, weights=None):
+        """
+        factors: dict of <column:True if the larger the better>, default to RANKING_FACTORS
+        weights: dict of <column:weight> of the scores in the total, default to 1
+        """
+        self.factors = factors if factors != None else RANKING_FACTORS
+        self.columns = list(self.factors.keys())
+        self.larger = np.array([bool(self.factors[c]) for c in self.columns])
+        self.weights = np.array([1.0 if weights == None else weights.get(c, 1.0) for c in self.columns])
+        self.rescored = 0 # number of stocks scored by the last call
+        self._index = None
+        self._values = None
+        self._scale = None
+        self._scores = None
+
+    def _factor_values(self, stocks):
+        missing = [c for c in self.columns if c not in stocks.columns]
+        if len(missing) > 0:
+            print('Error: ranking: missing columns %s' %missing)
+            return None
+        return stocks[self.columns].values.astype(float) # a copy, the input is not changed
+
+    def _column_scale(self, values):
+        # [fill, low, high, range] of every column, NaN is filled with range/2
+        with np.errstate(invalid='ignore'):
+            low = np.nanmin(values, axis=0) if len(values) > 0 else np.full(len(self.columns), np.nan)
+            high = np.nanmax(values, axis=0) if len(values) > 0 else np.full(len(self.columns), np.nan)
+        span = high - low
+        fill = span / 2
+        has_nan = np.isnan(values).any(axis=0)
+        # min and max after filling NaN
+        low = np.where(has_nan, np.fmin(low, fill), low)
+        high = np.where(has_nan, np.fmax(high, fill), high)
+        return np.array([fill, low, high, span])
+
+    def _score_rows(self, values, scale, cols=slice(None)):
+        [fill, low, high, span] = scale[:, cols]
+        values = values[:, cols]
+        values = np.where(np.isnan(values), fill, values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(self.larger[cols], values - low, high - values) / span * 10
+        return np.round(scores)
+
+    def _table(self):
+        table = DataFrame(self._scores, index=self._index, columns=self.columns)
+        table['Total'] = np.nansum(self._scores * self.weights, axis=1)
+        return table.sort_values('Total', ascending=False, kind='mergesort')
+
+    def score(self, stocks):
+        """
+        Score all stocks.
+
+        stocks: DataFrame of stock stats, e.g. Index.components
+        Return: DataFrame of the scores and 'Total', sorted by 'Total' descendingly.
+        """
+        values = self._factor_values(stocks)
+        if values is None:
+            return DataFrame()
+        self._index = stocks.index.copy()
+        self._values = values
+        self._scale = self._column_scale(values)
+        self._scores = self._score_rows(values, self._scale)
+        self.rescored = len(values)
+        return self._table()
+
+    def update(self, stocks):
+        """
+        Score stocks after some of their stats changed, e.g. on every refresh. Only the changed
+        stocks are scored again, unless the min, max or NaN fill of a column changed, then that
+        column is scored again for all stocks.
+
+        stocks: DataFrame with the same index as the last call, otherwise all are scored
+        Return: see score().
+        """
+        if self._index is None or not stocks.index.equals(self._index):
+            return self.score(stocks)
+        values = self._factor_values(stocks)
+        if values is None:
+            return DataFrame()
+        changed = ((values != self._values) & ~(np.isnan(values) & np.isnan(self._values))).any(axis=1)
+        rows = np.nonzero(changed)[0]
+        self.rescored = len(rows)
+        if len(rows) == 0:
+            return self._table()
+        scale = self._column_scale(values)
+        cols = np.nonzero(~((scale == self._scale) | (np.isnan(scale) & np.isnan(self._scale))).all(axis=0))[0]
+        self._values = values
+        self._scale = scale
+        self._scores[rows] = self._score_rows(values[rows], scale)
+        if len(cols) > 0:
+            self._scores[:, cols] = self._score_rows(values, scale, cols)
+            self.rescored = len(values)
+        return self._table()
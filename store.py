@@ -0,0 +1,190 @@
+import os
+import glob
+import json
+import pandas as pd
+import numpy as np
+from pandas import DataFrame
+
+#
+# Binary columnar quote store.
+#
+# The quotes of a symbol are kept next to its other data files as
+#     quotes.json          - manifest: generation, columns, number of rows, first and last dates
+#     quotes.dates.G.npy   - int64 nanoseconds since epoch, one per row
+#     quotes.values.G.npy  - float64 matrix of rows x columns
+# The .npy files are opened as read-only memory maps, so loading a symbol does not parse
+# any text and does not copy the data until it is modified.
+#
+# Every save writes the data files of a new generation G and then replaces the manifest, the
+# only pointer to them, so a reader or a crash sees either the old or the new store as a whole.
+# The files of the previous generation are kept for readers that have just read the old
+# manifest, older ones are removed. Version 1 stores are generation 0, without G in the names.
+#
+STORE_VERSION = 2
+
+def _store_files(prefix, generation=0):
+    if generation == 0:
+        return {'manifest': prefix + '.json',
+                'dates': prefix + '.dates.npy',
+                'values': prefix + '.values.npy'}
+    return {'manifest': prefix + '.json',
+            'dates': prefix + '.dates.%d.npy' %generation,
+            'values': prefix + '.values.%d.npy' %generation}
+
+def _remove_generations(prefix, keep):
+    # remove the data files of the generations not in keep
+    for key in ['dates', 'values']:
+        names = glob.glob(glob.escape(prefix) + '.%s.*.npy' %key) + [_store_files(prefix)[key]]
+        for name in names:
+            g = name[len(prefix + '.%s.' %key):-len('.npy')]
+            g = int(g) if g.isdigit() else 0
+            if g not in keep and os.path.isfile(name):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass # e.g. still memory-mapped on Windows, removed by a later save
+
+def has_quotes(prefix):
+    """
+    Check if there is a quote store at the given prefix, e.g. './data/AAPL/quotes'.
+    """
+    return os.path.isfile(_store_files(prefix)['manifest'])
+
+def save_quotes(quotes, prefix):
+    """
+    Save history quotes into the binary store.
+
+    quotes: DataFrame indexed by date, e.g. from Symbol.get_quotes()
+    prefix: path prefix of the store files, e.g. './data/AAPL/quotes'
+    """
+    if quotes.empty:
+        return
+    path = os.path.dirname(prefix)
+    if path != '' and not os.path.isdir(path):
+        os.makedirs(path)
+    old = load_manifest(prefix)
+    generation = old.get('generation', 0) + 1 if old != None else 1
+    files = _store_files(prefix, generation)
+    dates = pd.to_datetime(quotes.index).values.astype('datetime64[ns]').astype(np.int64)
+    values = np.ascontiguousarray(quotes.values, dtype=float)
+    # the data files of a new generation first, then the manifest pointing to them
+    for key, data in [('dates', dates), ('values', values)]:
+        tmp = files[key] + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, files[key])
+    manifest = {'version': STORE_VERSION,
+                'generation': generation,
+                'columns': [str(c) for c in quotes.columns],
+                'rows': len(quotes),
+                'first': str(pd.Timestamp(dates[0]).date()),
+                'last': str(pd.Timestamp(dates[-1]).date())}
+    tmp = files['manifest'] + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, files['manifest'])
+    _remove_generations(prefix, keep=[generation, generation - 1])
+
+def load_manifest(prefix):
+    """
+    Read the manifest of a quote store, return None if it doesn't exist.
+    """
+    if not has_quotes(prefix):
+        return None
+    with open(_store_files(prefix)['manifest']) as f:
+        return json.load(f)
+
+def load_quotes(prefix, mmap=True):
+    """
+    Load history quotes from the binary store.
+
+    prefix: path prefix of the store files, e.g. './data/AAPL/quotes'
+    mmap: memory-map the data (read-only), otherwise read it into memory
+    Return: DataFrame with a DatetimeIndex named 'Date', or an empty DataFrame.
+    """
+    mode = 'r' if mmap else None
+    for retry in range(3):
+        manifest = load_manifest(prefix)
+        if manifest == None:
+            return DataFrame()
+        files = _store_files(prefix, manifest.get('generation', 0))
+        try:
+            dates = np.load(files['dates'], mmap_mode=mode)
+            values = np.load(files['values'], mmap_mode=mode)
+            break
+        except FileNotFoundError:
+            continue # removed by two saves since the manifest was read
+    else:
+        print('Error: failed to load quotes from %s.' %prefix)
+        return DataFrame()
+    rows = manifest['rows']
+    index = pd.DatetimeIndex(dates[:rows].view('datetime64[ns]'), name='Date')
+    return DataFrame(values[:rows], index=index, columns=manifest['columns'], copy=False)
+
+def load_csv_quotes(csvfile):
+    """
+    Load history quotes from a legacy quotes.csv, with the dates parsed.
+    """
+    quotes = pd.read_csv(csvfile, index_col='Date', parse_dates=True)
+    return quotes
+
+def migrate_csv_quotes(datapath='./data', remove_csv=False):
+    """
+    One-shot migration of all quotes.csv files under datapath into the binary store.
+
+    remove_csv: delete the CSV files after they are converted
+    Return: a list of the migrated directories.
+    """
+    migrated = []
+    for root, dirs, files in os.walk(datapath):
+        if 'quotes.csv' not in files:
+            continue
+        csvfile = os.path.join(root, 'quotes.csv')
+        prefix = os.path.join(root, 'quotes')
+        try:
+            quotes = load_csv_quotes(csvfile)
+        except (ValueError, KeyError, pd.errors.ParserError) as e:
+            print('Error: failed to parse %s: %s' %(csvfile, e))
+            continue
+        save_quotes(quotes, prefix)
+        if remove_csv:
+            os.remove(csvfile)
+        migrated.append(root)
+    print('Migrated %d quote files under %s.' %(len(migrated), datapath))
+    return migrated
+
+def merge_quotes(quotes, tail, columns=['Adj Close', 'Close'], rtol=1e-6):
+    """
+    Append newly downloaded quotes to the stored history.
+
+    quotes: stored history quotes
+    tail: quotes downloaded from the last stored date (inclusive) onwards
+    columns: columns compared on the boundary bar
+    Return: [merged quotes, restated]
+
+    The last stored bar must be in tail and agree with it. Otherwise the history has been
+    restated (e.g. a split or dividend changed the adjusted prices), restated is True and the
+    stored quotes are returned unchanged, so the full history should be downloaded again.
+    """
+    if tail is None or tail.empty:
+        return [quotes, False]
+    if quotes.empty:
+        return [tail, False]
+    quotes = quotes.set_index(pd.to_datetime(quotes.index))
+    tail = tail.set_index(pd.to_datetime(tail.index))
+    last = quotes.index[-1]
+    if last not in tail.index:
+        return [quotes, True]
+    for col in columns:
+        if col not in quotes.columns or col not in tail.columns:
+            continue
+        old = quotes[col].iloc[-1]
+        new = tail[col].loc[last]
+        if not np.isclose(old, new, rtol=rtol, equal_nan=True):
+            return [quotes, True]
+    new_bars = tail[tail.index > last]
+    if new_bars.empty:
+        return [quotes, False]
+    merged = pd.concat([quotes, new_bars[quotes.columns]])
+    merged.index.name = quotes.index.name
+    return [merged, False]
@@ -1,7 +1,13 @@
+import threading
 from stock_analysis.utils import *
+from stock_analysis.store import *
+from stock_analysis.cache import IndicatorCache
+from stock_analysis.fundamentals import get_fundamentals
+from stock_analysis.financials import capture_financials, load_financials_html
+from stock_analysis import instrument
 
 # conda install -c conda-forge selenium=3.0.1
-from selenium import webdriver
+webdriver = LazyModule('selenium.webdriver')
 
 def parse_google_financial_table(tables, keyword=None):
     """
@@ -37,13 +43,20 @@ def parse_google_financial_table(tables, keyword=None):
     fin_df = fin_df.set_index('Entries')
     return fin_df
 
+def _day_ordinals(dates):
+    # dates (strings, datetime.date or Timestamps) to int64 days since epoch
+    if isinstance(dates, pd.Index):
+        return pd.to_datetime(dates).values.astype('datetime64[D]').astype(np.int64)
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
 class Symbol:
     """
     Class of a stock symbol.
     """
-    def __init__(self, sym, name=None, start=DEFAULT_START_DATE, end=None, datapath='./data', loaddata=True):
+    def __init__(self, sym, name=None, start=DEFAULT_START_DATE, end=None, datapath='./data', loaddata=True, cachesize=128):
         self.sym = sym # e.g. 'AAPL'
         self.exch = None # stock exchange symbol, e.g. NMS, NYQ
+        self.cache = IndicatorCache(cachesize) # indicators computed from quotes, see _cached()
         self.quotes = DataFrame()
         self.stats = DataFrame()
         self.income = DataFrame()  # Income Statement
@@ -54,15 +67,44 @@ class Symbol:
             self.datapath = os.path.normpath(datapath+'/'+name)
         else:
             self.datapath = os.path.normpath(datapath+'/'+sym)
-        self.files = {'quotes':self.datapath + '/quotes.csv',
+        self.files = {'quotes':self.datapath + '/quotes.csv', # legacy CSV, read only
+                      'store':self.datapath + '/quotes', # binary quote store, see store.py
                       'stats':self.datapath + '/stats.csv',
+                      'fundamentals':os.path.dirname(self.datapath) + '/fundamentals.json', # shared by all symbols, see fundamentals.py
                       'income':self.datapath + '/income.csv',
                       'balance':self.datapath + '/balance.csv',
-                      'cashflow':self.datapath + '/cashflow.csv'}
+                      'cashflow':self.datapath + '/cashflow.csv',
+                      'financials':self.datapath + '/financials.html'} # saved statement page, see financials.py
         [self.start_date, self.end_date] = parse_start_end_date(start, end)
         if loaddata:
             self.load_data(from_file=True)
 
+    @property
+    def quotes(self):
+        return self._quotes
+
+    @quotes.setter
+    def quotes(self, quotes):
+        self._quotes = quotes
+        self.cache.clear() # replaced quotes invalidate all cached indicators
+
+    def _quotes_fingerprint(self):
+        # appending bars or restating the last one changes the fingerprint
+        if self._quotes.empty:
+            return None
+        return (len(self._quotes), self._quotes.index[-1], self._quotes.iloc[-1].sum())
+
+    def _cached(self, key, calc):
+        """
+        Memoize an indicator computed from quotes.
+
+        key: indicator name, parameters and date range, e.g. ('ema', 10, start_date, end_date)
+        calc: function computing the indicator
+        The returned objects are shared with the cache and must not be modified in place.
+        """
+        self.cache.validate(self._quotes_fingerprint())
+        return self.cache.get(key, calc)
+
     def _handle_start_end_dates(self, start, end):
         if start == None and end == None:
             return [self.start_date, self.end_date]
@@ -86,12 +128,44 @@ class Symbol:
             sym = self.sym
         try:
             self.quotes = web.DataReader(sym, "yahoo", start_date, end_date)
-        except RemoteDataError:
+        except pdr_utils.RemoteDataError:
             print('Error: failed to get quotes for '+sym+' from Yahoo Finance.')
             return None
         self.start_date = self.quotes.first_valid_index().date() # update start date
         return self.quotes
 
+    def update_quotes(self, save=True):
+        """
+        Incrementally update history quotes: only the bars after the last stored one are downloaded.
+
+        The last stored bar is downloaded again and compared, if it has been restated
+        (e.g. by a split or dividend), the full history is downloaded instead.
+        save: save the updated quotes into the quote store
+        """
+        if self.quotes.empty and has_quotes(self.files['store']):
+            self.quotes = load_quotes(self.files['store'])
+        if self.quotes.empty:
+            quotes = self.get_quotes()
+        else:
+            last_date = pd.to_datetime(self.quotes.last_valid_index()).date()
+            end_date = dt.date.today()
+            if last_date >= end_date:
+                return self.quotes # up to date
+            try:
+                tail = web.DataReader(self.sym, "yahoo", last_date, end_date)
+            except pdr_utils.RemoteDataError:
+                print('Error: failed to get quotes for '+self.sym+' from Yahoo Finance.')
+                return None
+            [quotes, restated] = merge_quotes(self.quotes, tail)
+            if restated:
+                print('%s: history quotes restated since %s, downloading full history.' %(self.sym, last_date))
+                quotes = self.get_quotes(start=DEFAULT_START_DATE, end=end_date)
+            else:
+                self.quotes = quotes
+        if save and quotes is not None and not quotes.empty:
+            save_quotes(self.quotes, self.files['store'])
+        return quotes
+
     def get_financials(self, exchange=None, browser=None):
         """
         Download financial data from Google Finance.
@@ -152,11 +226,35 @@ class Symbol:
             return
         else:
             self.cashflow = parse_google_financial_table(tables, 'Amortization')
+        self._numeric_financials()
 
         if close_browser:
             browser.close()
         return
 
+    def capture_financials(self, exchange=None):
+        """
+        Download the Google Finance statement page and save it, to be parsed by parse_financials().
+        No browser is needed.
+        """
+        if exchange == None:
+            if self.exch == None and 'Exchange' in self.stats.columns:
+                self.exch = self.stats['Exchange'][self.sym]
+            exchange = get_exchange_by_sym(self.exch)
+        return capture_financials(self.sym, exchange, self.files['financials'])
+
+    def parse_financials(self):
+        """
+        Parse income statement, balance sheet and cash flow from the saved statement page.
+        """
+        if not os.path.isfile(self.files['financials']):
+            print('Error: %s: statement page not captured.' %self.sym)
+            return
+        [self.income, self.balance, self.cashflow] = load_financials_html(self.files['financials'])
+        self._numeric_financials()
+        if self.income.empty:
+            print('Error: %s: failed to find income statement.' %self.sym)
+
     def get_edgar_report(self):
         """
         EDGAR stock report: http://www.nasdaq.com/symbol/nvda
@@ -170,9 +268,10 @@ class Symbol:
         Get stock data from file or web.
         """
         if from_file:
-            if os.path.isfile(self.files['quotes']):
-                self.quotes = pd.read_csv(self.files['quotes'])
-                self.quotes = self.quotes.set_index('Date')
+            if has_quotes(self.files['store']):
+                self.quotes = load_quotes(self.files['store'])
+            elif os.path.isfile(self.files['quotes']):
+                self.quotes = load_csv_quotes(self.files['quotes'])
 
             if os.path.isfile(self.files['stats']):
                 self.stats = pd.read_csv(self.files['stats'])
@@ -199,9 +298,18 @@ class Symbol:
             if os.path.isfile(self.files['cashflow']):
                 self.cashflow = pd.read_csv(self.files['cashflow'])
                 self.cashflow = self.cashflow.set_index('Entries')
+            self._numeric_financials()
         else:
             self.get_financials()
 
+    def _numeric_financials(self):
+        """
+        Convert the statements from strings, e.g. '1,234.00' or '-', into numbers once.
+        """
+        self.income = str2nums(self.income)
+        self.balance = str2nums(self.balance)
+        self.cashflow = str2nums(self.cashflow)
+
     def save_data(self):
         """
         Save stock data into files.
@@ -209,7 +317,7 @@ class Symbol:
         if not os.path.isdir(self.datapath):
             os.makedirs(self.datapath)
         if len(self.quotes) > 0:
-            self.quotes.to_csv(self.files['quotes'])
+            save_quotes(self.quotes, self.files['store'])
         if len(self.stats) > 0:
             self.stats.to_csv(self.files['stats'])
         self.save_financial_data()
@@ -227,21 +335,39 @@ class Symbol:
         if len(self.cashflow) > 0:
             self.cashflow.to_csv(self.files['cashflow'])
 
-    def return_on_investment(self, start=None, end=None, exclude_dividend=False):
+    def _date_ordinals(self):
         """
-        Calculate stock Return On Investiment(ROI, or Rate Of Return) for a given period.
-            Total Stock Return = ((P1 - P0) + D) / P0
-        where
-            P0 = Initial Stock Price
-            P1 = Ending Stock Price
-            D  = Dividends
+        Day ordinals of the quote dates, with Adj Close and its prefix sums,
+        so periods can be sliced by searchsorted instead of date strings.
+        """
+        def calc():
+            days = _day_ordinals(self.quotes.index)
+            adj_close = self.quotes['Adj Close'].values.astype(float)
+            valid = ~np.isnan(adj_close)
+            csum = np.concatenate([[0.], np.cumsum(np.where(valid, adj_close, 0))])
+            count = np.concatenate([[0], np.cumsum(valid)])
+            return [days, adj_close, csum, count]
+        return self._cached(('ordinals',), calc)
+
+    def returns(self, windows, exclude_dividend=False):
+        """
+        Calculate ROI for a batch of periods at once, see return_on_investment().
+
+        windows: list of (start, end) dates, both inclusive
+        Return: numpy array of ROI, -99999999 for the periods without quotes.
         """
         if self.quotes.empty:
             self.get_quotes()
-        [start_date, end_date] = self._handle_start_end_dates(start, end)
-        adj_close = self.quotes.loc[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d'),'Adj Close']
-        if self.quotes.empty or len(adj_close) < 1:
-            return -99999999
+        if self.quotes.empty or len(windows) == 0:
+            return np.zeros(len(windows)) - 99999999
+        [days, adj_close, csum, count] = self._date_ordinals()
+        starts = _day_ordinals([w[0] for w in windows])
+        ends = _day_ordinals([w[1] for w in windows])
+        first = np.searchsorted(days, starts, side='left')
+        last = np.searchsorted(days, ends, side='right') # exclusive
+        empty = last <= first
+        first = np.minimum(first, len(days)-1)
+        last = np.maximum(last, first+1)
         no_dividend = ('DividendYield' not in self.stats.columns) or np.isnan(self.stats['DividendYield'][self.sym])
         if exclude_dividend or no_dividend:
             dividend = 0
@@ -249,11 +375,27 @@ class Symbol:
             # For simplicity, suppose the dividend yield is calculated as
             #   Dividend Yield = (Annual Dividends Per Share) / (Avg Price Per Share)
             # This is not accurate and need to be enhanced.
-            dividend = self.stats['DividendYield'][self.sym] * adj_close.mean() / 100 # yearly dividend
-            dividend = dividend / 365 * (end_date-start_date).days # dividend in the range
-        roi = (adj_close[-1] - adj_close[0] + dividend) / adj_close[0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = (csum[last] - csum[first]) / (count[last] - count[first])
+            dividend = self.stats['DividendYield'][self.sym] * mean / 100 # yearly dividend
+            dividend = dividend / 365 * (ends - starts) # dividend in the range
+        with np.errstate(divide='ignore', invalid='ignore'):
+            roi = (adj_close[last-1] - adj_close[first] + dividend) / adj_close[first]
+        roi[empty] = -99999999
         return roi
 
+    def return_on_investment(self, start=None, end=None, exclude_dividend=False):
+        """
+        Calculate stock Return On Investiment(ROI, or Rate Of Return) for a given period.
+            Total Stock Return = ((P1 - P0) + D) / P0
+        where
+            P0 = Initial Stock Price
+            P1 = Ending Stock Price
+            D  = Dividends
+        """
+        [start_date, end_date] = self._handle_start_end_dates(start, end)
+        return self.returns([(start_date, end_date)], exclude_dividend)[0]
+
     def return_periodic(self, periods=6, freq='365D'):
         """
         Calculate periodic average/median returns.
@@ -264,16 +406,16 @@ class Symbol:
             self.get_quotes()
         if self.quotes.empty:
             return [np.nan, np.nan]
-        returns = []
         start_date = self.quotes.first_valid_index()
         end_date = self.quotes.last_valid_index()
         [start_date, end_date] = self._handle_start_end_dates(start_date, end_date)
         days = pd.date_range(end=end_date, periods=periods, freq=freq)[::-1] # The past (periods-1) periods in reverse order
+        windows = []
         for i in range(1, len(days)):
             if days[i].date() < start_date:
                 break # out of boundary
-            #print('yearly: %s - %s' %(days[i].ctime(), days[i-1].ctime()))  # FIXME: TEST
-            returns.append(self.return_on_investment(days[i], days[i-1], exclude_dividend=True))
+            windows.append((days[i], days[i-1]))
+        returns = self.returns(windows, exclude_dividend=True)
         if len(returns) > 0:
             ret_avg = np.mean(returns)
             ret_median = np.median(returns)
@@ -298,17 +440,18 @@ class Symbol:
 
         [end_date, three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago, five_year_ago] = get_stats_intervals(self.end_date)
 
-        quarter_return = self.return_on_investment(three_month_ago, end_date, exclude_dividend)
-        half_year_return = self.return_on_investment(half_year_ago, end_date, exclude_dividend)
-        one_year_return = self.return_on_investment(one_year_ago, end_date, exclude_dividend)
-        two_year_return = self.return_on_investment(two_year_ago, end_date, exclude_dividend)
-        three_year_return = self.return_on_investment(three_year_ago, end_date, exclude_dividend)
+        windows = [(start, end_date) for start in [three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago]]
+        [quarter_return, half_year_return, one_year_return, two_year_return, three_year_return] = self.returns(windows, exclude_dividend)
 
         [yearly_ret_avg, yearly_ret_median] = self.return_periodic(periods=6, freq='365D') # yearly returns in the past 5 years
         [quart_ret_avg, quarty_ret_median] = self.return_periodic(periods=13, freq='90D') # yearly returns in the past 3 years
 
-        adj_close = self.quotes.loc[one_year_ago.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d'),'Adj Close'].dropna()
-        if not adj_close.empty and len(adj_close) > 0:
+        [days, adj_close, csum, count] = self._date_ordinals()
+        first = np.searchsorted(days, _day_ordinals([one_year_ago])[0], side='left')
+        last =np.searchsorted(days, _day_ordinals([end_date])[0], side='right')
+        adj_close = adj_close[first:last]
+        adj_close = adj_close[~np.isnan(adj_close)]
+        if len(adj_close) > 0:
             current = adj_close[-1]
             # Current price in 52-week range should between [0, 1] - larger number means more expensive.
             pos_in_range = (current - adj_close.min()) / (adj_close.max() - adj_close.min())
@@ -327,8 +470,10 @@ class Symbol:
         Return - pandas Series.
         """
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        stock = self.quotes["Adj Close"]
-        move_avg = pd.Series(moving_average(stock, n, type='simple'), index=stock.index)
+        def calc():
+            stock = self.quotes["Adj Close"]
+            return pd.Series(moving_average(stock, n, type='simple'), index=stock.index)
+        move_avg = self._cached(('sma', n), calc) # full history
         return move_avg[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].dropna()
 
     def ema(self, n=10, start=None, end=None):
@@ -341,11 +486,13 @@ class Symbol:
         if self.quotes.empty:
             return pd.Series()
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        # EMA is start date sensitive
-        tmp_start = start_date - BDay(n) # The first n days are used for init, so go back for n business days
-        stock = self.quotes['Adj Close'][tmp_start.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
-        avg = pd.Series(moving_average(stock, n, type='exponential'), index=stock.index)
-        return avg[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].dropna()
+        def calc():
+            # EMA is start date sensitive
+            tmp_start = start_date - BDay(n) # The first n days are used for init, so go back for n business days
+            stock = self.quotes['Adj Close'][tmp_start.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
+            avg = pd.Series(moving_average(stock, n, type='exponential'), index=stock.index)
+            return avg[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].dropna()
+        return self._cached(('ema', n, start_date, end_date), calc)
 
     def diverge_to_index(self, index, n=10, start=None, end=None):
         """
@@ -353,25 +500,29 @@ class Symbol:
         Exponential moving average is used for smoothing the prices.
 
         Inputs:
-            index - Symbol of index(e.g. sp500)
+            index - Symbol of index(e.g. sp500), or its shared Benchmark
             n - window passed to EMA
         Return - Pandas Series of differences
         """
         if self.quotes.empty:
             self.get_quotes()
-        if index.quotes.empty:
+        if index.quotes.empty and not isinstance(index, Benchmark):
             index.get_quotes()
         if self.quotes.empty or index.quotes.empty:
             return pd.Series()
         [start_date, end_date] = self._handle_start_end_dates(start, end)
         # use the latest available starting date
         start_date = max(self.quotes.first_valid_index().date(), index.quotes.first_valid_index().date(), start_date)
-        move_avg_index = index.ema(n, start_date, end_date).dropna()
+        if isinstance(index, Benchmark):
+            move_avg_index = index.normalized_ema(n, start_date, end_date)
+        else:
+            move_avg_index = index.ema(n, start_date, end_date).dropna()
         move_avg_symbol = self.ema(n, start_date, end_date).dropna()
         if move_avg_symbol.empty or move_avg_index.empty:
             return pd.Series()
-        move_avg_index /= move_avg_index[0] # normalization
-        move_avg_symbol /= move_avg_symbol[0] # normalization
+        if not isinstance(index, Benchmark):
+            move_avg_index = move_avg_index / move_avg_index.iloc[0] # normalization
+        move_avg_symbol = move_avg_symbol / move_avg_symbol.iloc[0] # normalization
         diff = move_avg_symbol - move_avg_index
         return diff
 
@@ -379,11 +530,12 @@ class Symbol:
         """
         Calculate stats of divergence to S&P 500.
 
-        index: a Symbol class of index, e.g. S&P 500.
+        index: a Symbol class of index, e.g. S&P 500, or its shared Benchmark.
         """
         if index == None:
-            index = Symbol('^GSPC', name='SP500') # S&P500
-            index.get_quotes() # only quotes needed
+            index = default_benchmark() # S&P500
+        elif not isinstance(index, Benchmark):
+            index = Benchmark(index) # shared by all the windows below
         labels = ['Symbol', 'HalfYearDivergeIndex', '1YearDivergeIndex', '2YearDivergeIndex', '3YearDivergeIndex', 'YearlyDivergeIndex']
         [end_date, three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago, five_year_ago] = get_stats_intervals(self.end_date)
         half_year_diverge = self.diverge_to_index(index, start=half_year_ago, end=end_date).mean()
@@ -428,19 +580,19 @@ class Symbol:
         if roc.empty or len(roc) < 1:
             roc_stat = np.nan
         else:
-            roc_stat = roc[-1]
+            roc_stat = roc.iloc[-1]
 
         rsi = self.rsi(start=start_date, end=end_date)
         if rsi.empty or len(rsi) < 1:
             rsi_stat = np.nan
         else:
-            rsi_stat = rsi[-1]
+            rsi_stat = rsi.iloc[-1]
 
         [macd, signal, diff] = self.macd(start=start_date, end=end_date)
         if diff.empty or len(diff) < 1:
             macd_stat = np.nan
         else:
-            macd_stat = diff[-1]
+            macd_stat = diff.iloc[-1]
 
         [K,D] = self.stochastic(start=start_date, end=end_date)
         if K.empty or len(K) < 1:
@@ -448,13 +600,13 @@ class Symbol:
             avg_fsto_past_month = np.nan
             avg_fsto_past_quarter = np.nan
         else:
-            fsto_stat = K[-1]
+            fsto_stat = K.iloc[-1]
             avg_fsto_past_month = K[one_month_ago.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].mean()
             avg_fsto_past_quarter = K.mean()
         if D.empty or len(D) < 1:
             ssto_stat = np.nan
         else:
-            ssto_stat = D[-1]
+            ssto_stat = D.iloc[-1]
 
         # ROC Trend
         seven_days_ago = end_date - dt.timedelta(days=7)
@@ -498,9 +650,9 @@ class Symbol:
         cash_investing = pd.Series()
         cash_financing = pd.Series()
 
-        fmt = lambda y: pd.Series([str(x).replace(',','').replace('-','0') for x in y], index=y.index)[::-1].astype(np.float)
+        fmt = lambda y: str2nums(y)[::-1].fillna(0) # '-' => 0
         if not self.income.empty:
-            if '-' not in self.income.loc['Revenue'].tolist():
+            if not str2nums(self.income.loc['Revenue']).isnull().any():
                 revenue = fmt(self.income.loc['Revenue'])
             else:
                 revenue = fmt(self.income.loc['Total Revenue'])
@@ -517,33 +669,25 @@ class Symbol:
             cash_investing = fmt(self.cashflow.loc['Cash from Investing Activities'])
             cash_financing = fmt(self.cashflow.loc['Cash from Financing Activities'])
 
+        # the trends of all the series at once, NaN values are skipped
+        series = {'CashOperating': cash_operating, 'CashInvesting': cash_investing, 'CashFinancing': cash_financing}
         if len(revenue) > 0:
-            revenue_momentum = find_trend(revenue, fit_poly=False)
             profit_margins = net_income / revenue
-            profit_margin_moment = find_trend(profit_margins.dropna(), fit_poly=False)
             operating_margins = operate_income / revenue
-            operate_margin_moment = find_trend(operating_margins.dropna(), fit_poly=False)
+            series.update({'Revenue': revenue, 'ProfitMargin': profit_margins, 'OperatingMargin': operating_margins})
         else:
-            revenue_momentum = 0
-            profit_margins = np.zeros(4)
-            profit_margin_moment = 0
-            operating_margins = np.zeros(4)
-            operate_margin_moment = 0
-
+            profit_margins = pd.Series(np.zeros(4))
+            operating_margins = pd.Series(np.zeros(4))
         if len(total_assets) > 0:
-            asset_momentum = find_trend(total_assets.dropna(), fit_poly=False)
             debt_to_assets = total_debt / total_assets
-            debt_assets_moment = find_trend(debt_to_assets.dropna(), fit_poly=False)
+            series.update({'TotalAssets': total_assets, 'Debt/Assets': debt_to_assets})
         else:
-            asset_momentum = 0
-            debt_to_assets = np.zeros(4)
-            debt_assets_moment = 0
+            debt_to_assets = pd.Series(np.zeros(4))
+        labels_trend = ['Revenue', 'ProfitMargin', 'OperatingMargin', 'TotalAssets', 'Debt/Assets', 'CashOperating', 'CashInvesting', 'CashFinancing']
+        trends = find_trends(DataFrame(series), fit_poly=False).reindex(labels_trend, fill_value=0)
+        [revenue_momentum, profit_margin_moment, operate_margin_moment, asset_momentum, debt_assets_moment, cash_operate_moment, cash_invest_moment, cash_finance_moment] = trends.tolist()
 
-        cash_operate_moment = find_trend(cash_operating.dropna(), fit_poly=False)
-        cash_invest_moment = find_trend(cash_investing.dropna(), fit_poly=False)
-        cash_finance_moment = find_trend(cash_financing.dropna(), fit_poly=False)
-
-        stats = [[self.sym, revenue_momentum, profit_margins[-1], profit_margins.mean(), profit_margin_moment, operating_margins[-1], operating_margins.mean(), operate_margin_moment, asset_momentum, debt_to_assets[-1], debt_to_assets.mean(), debt_assets_moment, cash_operate_moment, cash_invest_moment, cash_finance_moment]]
+        stats = [[self.sym, revenue_momentum, profit_margins.iloc[-1], profit_margins.mean(), profit_margin_moment, operating_margins.iloc[-1], operating_margins.mean(), operate_margin_moment, asset_momentum, debt_to_assets.iloc[-1], debt_to_assets.mean(), debt_assets_moment, cash_operate_moment, cash_invest_moment, cash_finance_moment]]
         stats_df = DataFrame(stats, columns=labels)
         stats_df = stats_df.drop_duplicates()
         stats_df = stats_df.set_index('Symbol')
@@ -559,7 +703,7 @@ class Symbol:
         labels = ['Symbol', 'EPSGrowth', 'Forward P/E']
         eps_growth = (self.stats['EPSEstimateNextYear'][self.sym] - self.stats['EPSEstimateCurrentYear'][self.sym]) / self.stats['EPSEstimateCurrentYear'][self.sym] * 100 # percent
         # Forward P/E = (current price / EPS estimate next year)
-        forward_pe = self.quotes['Adj Close'][-1] / self.stats['EPSEstimateNextYear'][self.sym]
+        forward_pe = self.quotes['Adj Close'].iloc[-1] / self.stats['EPSEstimateNextYear'][self.sym]
 
         stat = [[self.sym, eps_growth, forward_pe]]
         stat = DataFrame(stat, columns=labels)
@@ -571,34 +715,40 @@ class Symbol:
     def get_stats(self, index=None, exclude_name=False, exclude_dividend=False):
         """
         Calculate all stats.
-        index: Symbol of index
+        index: Symbol of index, or its shared Benchmark
         """
         if self.quotes.empty:
             self.get_quotes()
 
         # Yahoo Finance statistics - it must be downloaded before other stats
-        self.stats = get_symbol_yahoo_stats([self.sym], exclude_name=exclude_name)
-        self.exch = self.stats['Exchange'][self.sym]
+        with instrument.stage('fundamentals', self.sym):
+            self.stats = get_fundamentals([self.sym], exclude_name=exclude_name, cachefile=self.files['fundamentals'])
+            self.exch = self.stats['Exchange'][self.sym]
 
         # stats of return based on history quotes
-        return_stats = self.return_stats(exclude_dividend=exclude_dividend)
-        self.stats = self.stats.join(return_stats)
+        with instrument.stage('return', self.sym):
+            return_stats = self.return_stats(exclude_dividend=exclude_dividend)
+            self.stats = self.stats.join(return_stats)
 
         # diverge to index stats
-        diverge_stats = self.diverge_stats(index)
-        self.stats = self.stats.join(diverge_stats)
+        with instrument.stage('diverge', self.sym):
+            diverge_stats = self.diverge_stats(index)
+            self.stats = self.stats.join(diverge_stats)
 
         # trend & momentum
-        trend_stats = self.trend_stats()
-        self.stats = self.stats.join(trend_stats)
+        with instrument.stage('trend', self.sym):
+            trend_stats = self.trend_stats()
+            self.stats = self.stats.join(trend_stats)
 
         # financial stats
-        financial_stats = self.financial_stats(exchange=self.exch)
-        self.stats = self.stats.join(financial_stats)
+        with instrument.stage('financial', self.sym):
+            financial_stats = self.financial_stats(exchange=self.exch)
+            self.stats = self.stats.join(financial_stats)
 
         # additional stats
-        add_stats = self.additional_stats()
-        self.stats = self.stats.join(add_stats)
+        with instrument.stage('additional', self.sym):
+            add_stats = self.additional_stats()
+            self.stats = self.stats.join(add_stats)
 
         return self.stats.transpose() # transpose for the sake of display
 
@@ -615,9 +765,10 @@ class Symbol:
         if self.quotes.empty:
             return pd.Series()
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        stock = self.quotes["Adj Close"] # calc momentum for all hist data
-        calc = lambda x: x[-1] - x[0]
-        m = stock.rolling(window = n, center = False).apply(calc).dropna()
+        def calc():
+            stock = self.quotes["Adj Close"] # calc momentum for all hist data
+            return pd.Series(momentum(stock, n), index=stock.index).dropna()
+        m = self._cached(('momentum', n), calc)
         return m[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
 
     def roc(self, n=10, start=None, end=None):
@@ -631,9 +782,10 @@ class Symbol:
         if self.quotes.empty:
             return pd.Series()
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        stock = self.quotes["Adj Close"]
-        calc = lambda x: (x[-1]/x[0] - 1) * 100
-        rates = stock.rolling(window = n, center = False).apply(calc).dropna()
+        def calc():
+            stock = self.quotes["Adj Close"]
+            return pd.Series(rate_of_change(stock, n), index=stock.index).dropna()
+        rates = self._cached(('roc', n), calc) # full history
         return rates[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
 
     def macd(self, start=None, end=None):
@@ -652,13 +804,17 @@ class Symbol:
         Return: list of [MACD Line, Signal Line, Histogram], all in pandas Series format.
         """
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        rng = pd.date_range(start=start_date, end=end_date, freq='D')
-        fastema = self.ema(n=12)
-        slowema = self.ema(n=26)
-        macdline = fastema-slowema
-        macdline = macdline.dropna()
-        signal = pd.Series(moving_average(macdline, n=9, type='exponential'), index=macdline.index)
-        hist = macdline-signal
+        rng = slice(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        def calc():
+            fastema = self.ema(n=12)
+            slowema = self.ema(n=26)
+            macdline = fastema-slowema
+            macdline = macdline.dropna()
+            signal = pd.Series(moving_average(macdline, n=9, type='exponential'), index=macdline.index)
+            hist = macdline-signal
+            return [macdline, signal, hist]
+        # full history, the EMAs depend on the default date range
+        [macdline, signal, hist] = self._cached(('macd', self.start_date, self.end_date), calc)
         return [macdline[rng].dropna(), signal[rng].dropna(), hist[rng].dropna()]
 
     def rsi(self, n=14, start=None, end=None):
@@ -690,32 +846,12 @@ class Symbol:
 
         # RSI is start date sensitive
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        tmp_start = start_date - BDay(n) # The first n days are used for init, so go back for n business days
-        prices = self.quotes['Adj Close'][tmp_start.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
-        m = np.diff(prices)
-
-        # initialization
-        seed = m[:n+1] # cause the diff is 1 shorter
-        up = seed[seed>=0].sum()/n
-        down = -seed[seed<0].sum()/n # losses should be positive
-        rsi = np.zeros_like(prices)
-        rsi[:n] = 100. - 100./(1. + up/down)
-
-        # subsequent calculations
-        for i in np.arange(n, len(prices)):
-            d = m[i-1]
-            if d > 0:
-                gain = d
-                loss = 0
-            else:
-                gain = 0
-                loss = -d  # losses should be positive
-            up = (up*(n - 1) + gain)/n
-            down = (down*(n - 1) + loss)/n
-            rsi[i] = 100. - 100/(1. + up/down)
-
-        rsi = pd.Series(rsi, index=prices.index) # price diff drops the fist date
-        return rsi[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].dropna()
+        def calc():
+            tmp_start = start_date - BDay(n) # The first n days are used for init, so go back for n business days
+            prices = self.quotes['Adj Close'][tmp_start.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')]
+            rsi = pd.Series(relative_strength_index(prices, n), index=prices.index)
+            return rsi[start_date.strftime('%Y-%m-%d'):end_date.strftime('%Y-%m-%d')].dropna()
+        return self._cached(('rsi', n, start_date, end_date), calc)
 
     def stochastic(self, nK=14, nD=3, start=None, end=None):
         """
@@ -741,22 +877,18 @@ class Symbol:
         if len(close) <= nK:
             return [pd.Series(), pd.Series()]
 
-        ratio = self.quotes['Adj Close'] / self.quotes['Close']
-        high = self.quotes['High'] * ratio # adjusted high
-        low = self.quotes['Low'] * ratio   # adjusted low
-
-        sto = np.zeros_like(close)
-        for i in np.arange(nK, len(close)+1):
-            s = close[i-nK : i]
-            h = high[i-nK : i]
-            l = low[i-nK : i]
-            sto[i-1] = (s[-1]-min(l))/(max(h)-min(l)) * 100
-        sto[:nK-1] = sto[nK-1]
-        K = pd.Series(sto, index=close.index)
-        D = pd.Series(moving_average(K, n=nD, type='simple'), index=K.index)
+        def calc():
+            ratio = self.quotes['Adj Close'] / self.quotes['Close']
+            high = self.quotes['High'] * ratio # adjusted high
+            low = self.quotes['Low'] * ratio   # adjusted low
+            [sto, sto_avg] = stochastic_oscillator(close, high, low, nK, nD)
+            K = pd.Series(sto, index=close.index)
+            D = pd.Series(sto_avg, index=K.index)
+            return [K, D]
+        [K, D] = self._cached(('stochastic', nK, nD), calc) # full history
 
         [start_date, end_date] = self._handle_start_end_dates(start, end)
-        rng = pd.date_range(start=start_date, end=end_date, freq='D')
+        rng = slice(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
         return [K[rng].dropna(), D[rng].dropna()]
 
     def plot(self, start=None, end=None):
@@ -866,3 +998,91 @@ class Symbol:
         # and http://openinsider.com/search?q=AMD
         # TODO: download insider trade history
         return
+
+
+class Benchmark(object):
+    """
+    Read-only benchmark context of an index, shared by all symbols for diverge_to_index().
+
+    It keeps a snapshot of the index's Adj Close, and its normalized EMA is computed once per
+    (n, start, end) and reused by every symbol, in threads or (after pickling) in processes.
+    """
+    def __init__(self, index):
+        """
+        index: Symbol of index with quotes, e.g. Index.sym
+        """
+        self.sym = index.sym
+        self.index = Symbol(index.sym, name=index.name, loaddata=False)
+        if not index.quotes.empty:
+            self.index.quotes = index.quotes[['Adj Close']]
+        self._normalized = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def quotes(self):
+        return self.index.quotes
+
+    def __getstate__(self):
+        # locks can't be pickled, e.g. when sent to mp.Pool workers
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def ema(self, n=10, start=None, end=None):
+        return self.index.ema(n, start, end)
+
+    def normalized_ema(self, n=10, start=None, end=None):
+        """
+        EMA of the index normalized by its first value, see Symbol.diverge_to_index().
+        The returned Series is shared and must not be modified.
+        """
+        [start_date, end_date] = parse_start_end_date(start, end)
+        key = (n, start_date, end_date)
+        with self._lock:
+            if key in self._normalized:
+                return self._normalized[key]
+        move_avg = self.index.ema(n, start_date, end_date).dropna()
+        if not move_avg.empty:
+            values = move_avg.values / move_avg.values[0] # normalization
+            values.setflags(write=False)
+            move_avg = pd.Series(values, index=move_avg.index)
+        with self._lock:
+            self._normalized[key] = move_avg
+        return move_avg
+
+    def precompute(self, end=None, n=10):
+        """
+        Compute the normalized EMA of the windows used by Symbol.diverge_stats(), e.g. before
+        the benchmark is sent to worker processes.
+        """
+        if self.quotes.empty:
+            return
+        [start_date, end_date] = parse_start_end_date(None, end)
+        [end_date, three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago, five_year_ago] = get_stats_intervals(end_date)
+        first = self.quotes.first_valid_index().date()
+        for start in [half_year_ago, one_year_ago, two_year_ago, three_year_ago]:
+            self.normalized_ema(n, max(first, start), end_date)
+        days = pd.date_range(end=end_date, periods=6, freq='365D')[::-1]
+        for i in range(1, len(days)):
+            if days[i].date() < first:
+                break
+            self.normalized_ema(n, days[i].date(), days[i-1].date())
+
+_default_benchmark = None
+_default_benchmark_lock = threading.Lock()
+
+def default_benchmark():
+    """
+    Benchmark of S&P 500, loaded from the quote store (or downloaded) once per process.
+    """
+    global _default_benchmark
+    with _default_benchmark_lock:
+        if _default_benchmark == None:
+            index = Symbol('^GSPC', name='SP500') # S&P500
+            index.update_quotes() # only quotes needed
+            _default_benchmark = Benchmark(index)
+    return _default_benchmark
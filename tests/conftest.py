@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the directory containing the stock_analysis package, i.e. the parent of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
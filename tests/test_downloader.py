@@ -0,0 +1,129 @@
+import time
+import asyncio
+import threading
+import datetime as dt
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from stock_analysis.downloader import QuoteDownloader
+
+CSV = ('Date,Open,High,Low,Close,Adj Close,Volume\n'
+       '2017-01-03,10.0,11.0,9.5,10.5,10.4,1000\n'
+       '2017-01-04,10.5,11.5,10.0,11.0,10.9,1200\n'
+       '2017-01-05,11.0,11.2,10.1,10.2,10.1,900\n').encode('utf-8')
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Canned responses by symbol:
+        FLAKY - 503 for the first two requests, then the quotes
+        MISSING - 404
+        GARBAGE - 200 with a body that isn't CSV
+        STALL - no response for 2 seconds
+        others - the quotes
+    """
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def setup(self):
+        super(StubHandler, self).setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        sym = self.path.split('?')[0].rsplit('/', 1)[-1]
+        self.server.requests.append(sym)
+        status = 200
+        body = CSV
+        if sym == 'FLAKY' and self.server.requests.count(sym) <= 2:
+            status = 503
+            body = b'busy'
+        elif sym == 'MISSING':
+            status = 404
+            body = b'not found'
+        elif sym == 'GARBAGE':
+            body = b'\xff\xfe<html>oops</html>'
+        elif sym == 'STALL':
+            time.sleep(2)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    httpd.daemon_threads = True
+    httpd.connections = 0
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def new_downloader(server, **kwargs):
+    url = 'http://127.0.0.1:%d/v7/finance/download' %server.server_address[1]
+    return QuoteDownloader(base_url=url, backoff=0.01, **kwargs)
+
+START = dt.date(2017, 1, 1)
+END = dt.date(2017, 1, 31)
+
+def test_keep_alive_reuses_connections(server):
+    downloader = new_downloader(server, concurrency=1)
+    quotes = downloader.download(['A', 'B', 'C', 'D'], START, END)
+    assert sorted(quotes) == ['A', 'B', 'C', 'D']
+    assert list(quotes['A'].columns) == ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close']
+    assert len(quotes['A']) == 3
+    assert downloader.connections == 1
+    assert server.connections == 1
+    assert downloader.requests == 4
+
+def test_retries_on_5xx(server):
+    downloader = new_downloader(server, retries=3)
+    quotes = downloader.download(['FLAKY'], START, END)
+    assert 'FLAKY' in quotes
+    assert server.requests.count('FLAKY') == 3
+    assert downloader.errors == {}
+
+def test_gives_up_after_retries(server):
+    downloader = new_downloader(server, retries=1)
+    quotes = downloader.download(['FLAKY'], START, END)
+    assert quotes == {}
+    assert downloader.errors == {'FLAKY': 'HTTP 503'}
+
+def test_404_is_not_retried(server):
+    downloader = new_downloader(server)
+    quotes = downloader.download(['MISSING', 'A'], START, END)
+    assert list(quotes) == ['A']
+    assert downloader.errors == {'MISSING': 'HTTP 404'}
+    assert server.requests.count('MISSING') == 1
+
+def test_invalid_body_is_an_error_of_the_symbol(server):
+    downloader = new_downloader(server)
+    quotes = downloader.download(['GARBAGE', 'A'], START, END)
+    assert list(quotes) == ['A']
+    assert list(downloader.errors) == ['GARBAGE']
+
+def test_timeout(server):
+    downloader = new_downloader(server, retries=0, timeout=0.3)
+    t = time.time()
+    quotes = downloader.download(['STALL'], START, END)
+    assert quotes == {}
+    assert 'STALL' in downloader.errors
+    assert time.time() - t < 1.5
+
+def test_per_symbol_start_dates(server):
+    downloader = new_downloader(server)
+    quotes = downloader.download(['A', 'B'], {'A': START, 'B': dt.date(2017, 1, 5)}, END)
+    assert len(quotes['A']) == 3
+    assert len(quotes['B']) == 1
+
+def test_download_in_running_event_loop(server):
+    downloader = new_downloader(server)
+    async def notebook_cell():
+        return downloader.download(['A'], START, END)
+    quotes = asyncio.run(notebook_cell())
+    assert list(quotes) == ['A']
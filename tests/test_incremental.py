@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_analysis.symbol import Symbol
+from stock_analysis.incremental import EMA, SMA, RSI, MACD, Stochastic, ROC, load_indicator
+
+HISTORY = 1000 # bars the indicators are seeded with, the rest are updates
+
+def new_symbol(quotes):
+    stock = Symbol('X', loaddata=False, start='2015-01-01', end='2020-12-31')
+    stock.quotes = quotes
+    return stock
+
+@pytest.fixture(scope='module')
+def quotes():
+    rng = np.random.default_rng(5)
+    dates = pd.bdate_range('2015-01-01', '2020-12-31', name='Date')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    return pd.DataFrame({'Close': close * 1.1,
+                         'High': close * 1.1 * (1 + np.abs(rng.normal(0, 0.01, len(dates)))),
+                         'Low': close * 1.1 * (1 - np.abs(rng.normal(0, 0.01, len(dates)))),
+                         'Adj Close': close}, index=dates)
+
+@pytest.fixture(scope='module')
+def batch(quotes):
+    # the values of the batch methods of Symbol over the full history
+    stock = new_symbol(quotes)
+    [macd, signal, hist] = stock.macd(start='2000-01-01')
+    [K, D] = stock.stochastic(start='2000-01-01')
+    return {'ema': stock.ema(10).values, 'sma': stock.sma(20).values, 'rsi': stock.rsi(14).values,
+            'macd': np.column_stack([macd.values, signal.values, hist.values]),
+            'stochastic': np.column_stack([K.values, D.values]), 'roc': stock.roc(10).values}
+
+INDICATORS = {'ema': lambda: EMA(n=10), 'sma': lambda: SMA(n=20), 'rsi': lambda: RSI(n=14),
+              'macd': lambda: MACD(), 'stochastic': lambda: Stochastic(), 'roc': lambda: ROC(n=10)}
+
+# Symbol.roc() drops the first n-1 values
+OFFSET = {'roc': 9}
+
+@pytest.mark.parametrize('name', sorted(INDICATORS))
+def test_seed_update_save_load_match_batch(name, quotes, batch, tmp_path):
+    ind = INDICATORS[name]()
+    ind.seed(ind._bars(quotes.iloc[:HISTORY]))
+    ind.save(str(tmp_path / 'indicator.json'))
+    ind = load_indicator(str(tmp_path / 'indicator.json'))
+    assert type(ind) == type(INDICATORS[name]())
+    values = [ind.update_bar(quotes.iloc[i]) for i in range(HISTORY, len(quotes))]
+    expected = batch[name][HISTORY - OFFSET.get(name, 0):]
+    np.testing.assert_allclose(np.array(values, dtype=float), expected, rtol=1e-9, atol=1e-9)
+
+# bars from which updating from scratch gives the batch values, after the warmup
+FROM_SCRATCH = {'ema': 9, 'sma': 20, 'rsi': 15, 'macd': 25, 'stochastic': 16, 'roc': 9}
+
+@pytest.mark.parametrize('name', sorted(INDICATORS))
+def test_update_from_scratch_matches_batch(name, quotes, batch):
+    ind = INDICATORS[name]()
+    values = [ind.update_bar(quotes.iloc[i]) for i in range(len(quotes))]
+    start = FROM_SCRATCH[name]
+    values = np.array(values[start:], dtype=float)
+    expected = batch[name][start - OFFSET.get(name, 0):]
+    if name == 'macd':
+        # the MACD line and histogram are seeded differently before the warmup, the signal line is not
+        values = values[:, 1]
+        expected = expected[:, 1]
+    np.testing.assert_allclose(values, expected, rtol=1e-9, atol=1e-9)
+
+def test_from_symbol_matches_seed(quotes):
+    stock = new_symbol(quotes.iloc[:HISTORY])
+    a = RSI.from_symbol(stock, n=14)
+    b = RSI(n=14)
+    b.seed(b._bars(stock.quotes))
+    assert a.value == b.value
+    assert a.update(101.0) == b.update(101.0)
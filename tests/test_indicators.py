@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_analysis.utils import momentum, rate_of_change
+
+# the rolling lambdas momentum() and rate_of_change() replaced, see Symbol.momentum()/roc()
+def old_momentum(p, n):
+    return p.rolling(window=n, center=False).apply(lambda x: x[-1] - x[0], raw=True)
+
+def old_rate_of_change(p, n):
+    return p.rolling(window=n, center=False).apply(lambda x: (x[-1]/x[0] - 1) * 100, raw=True)
+
+def random_walk(days, seed=0, gaps=0.05):
+    rng = np.random.default_rng(seed)
+    p = pd.Series(50 * np.exp(np.cumsum(0.02 * rng.standard_normal(days))),
+                  index=pd.bdate_range('2015-01-02', periods=days))
+    p[rng.random(days) < gaps] = np.nan
+    return p
+
+@pytest.mark.parametrize('n', [2, 10])
+@pytest.mark.parametrize('gaps', [0.0, 0.05])
+def test_kernels_match_rolling_lambdas(n, gaps):
+    p = random_walk(500, gaps=gaps)
+    np.testing.assert_allclose(momentum(p, n), old_momentum(p, n).values, rtol=1e-12)
+    np.testing.assert_allclose(rate_of_change(p, n), old_rate_of_change(p, n).values, rtol=1e-12)
+
+@pytest.mark.parametrize('days', [0, 1, 5, 9])
+def test_history_shorter_than_window(days):
+    p = random_walk(days, gaps=0.0)
+    for [new, old] in [(momentum, old_momentum), (rate_of_change, old_rate_of_change)]:
+        out = new(p, 10)
+        assert out.shape == (days,)
+        assert np.isnan(out).all()
+        np.testing.assert_array_equal(out, old(p, 10).values)
+
+def test_matrix_and_window_list():
+    quotes = pd.concat([random_walk(300, seed=s) for s in range(4)], axis=1)
+    out = rate_of_change(quotes.values, [2, 10])
+    assert out.shape == (2,) + quotes.shape
+    for k, n in enumerate([2, 10]):
+        for j in range(quotes.shape[1]):
+            np.testing.assert_allclose(out[k, :, j], old_rate_of_change(quotes[j], n).values, rtol=1e-12)
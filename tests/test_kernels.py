@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+
+from stock_analysis.utils import moving_average, relative_strength_index
+from stock_analysis.utils import rolling_max, rolling_min, stochastic_oscillator
+from stock_analysis.utils import find_trend, find_trends, rolling_trend
+
+# the implementations the kernels replaced, from Symbol.rsi(), Symbol.stochastic(),
+# utils.moving_average() and utils.find_trend() before
+def old_rsi(prices, n=14):
+    m = np.diff(prices)
+    seed = m[:n+1] # cause the diff is 1 shorter
+    up = seed[seed>=0].sum()/n
+    down = -seed[seed<0].sum()/n # losses should be positive
+    rsi = np.zeros_like(prices)
+    rsi[:n] = 100. - 100./(1. + up/down)
+    for i in np.arange(n, len(prices)):
+        d = m[i-1]
+        if d > 0:
+            gain = d
+            loss = 0
+        else:
+            gain = 0
+            loss = -d  # losses should be positive
+        up = (up*(n - 1) + gain)/n
+        down = (down*(n - 1) + loss)/n
+        rsi[i] = 100. - 100/(1. + up/down)
+    return rsi
+
+def old_ema(x, n=10):
+    avg = np.zeros_like(x)
+    avg[:n] = x[:n].mean() # initialization
+    m = 2/(n+1) # multiplier
+    for i in np.arange(n, len(x)):
+        avg[i] = (x[i] - avg[i-1]) * m + avg[i-1]
+    return avg
+
+def old_sma(x, n=10):
+    w = np.ones(n)
+    w /= w.sum() # weights
+    avg = np.convolve(x, w, mode='full')[:len(x)]
+    avg[:n] = avg[n]
+    return avg
+
+def old_stochastic(close, high, low, nK=14, nD=3):
+    sto = np.zeros_like(close)
+    for i in np.arange(nK, len(close)+1):
+        s = close[i-nK : i]
+        h = high[i-nK : i]
+        l = low[i-nK : i]
+        sto[i-1] = (s[-1]-min(l))/(max(h)-min(l)) * 100
+    sto[:nK-1] = sto[nK-1]
+    return [sto, old_sma(sto, nD)]
+
+def old_find_trend(y, fit_poly=True):
+    if len(y) < 2:
+        return 0
+    if np.inf in list(y):
+        return np.nan
+    x = np.linspace(0, len(y), len(y))
+    yy = np.array(y, copy=True) # make a copy to avoid changing input data
+    if yy[0] == 0:
+        yy[0] += 0.0000001
+    yy /= yy[0] # normalization
+    if len(yy) < 4:
+        fit_poly = False
+    if fit_poly:
+        mid = int(len(yy)/2)
+        p1 = np.polyfit(np.arange(mid), yy[:mid], 1)
+        p2 = np.polyfit(np.arange(len(yy) - mid), yy[mid:], 1)
+        if (p1[0] > 0 and p2[0] < 0) or (p1[0] < 0 and p2[0] > 0):
+            return 0 # turnaround
+    p = np.polyfit(x, yy, 1)
+    return p[0]
+
+def random_walk(days, symbols=None, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (days,) if symbols == None else (days, symbols)
+    return 50 * np.exp(np.cumsum(0.02 * rng.standard_normal(shape), axis=0))
+
+@pytest.mark.parametrize('n', [2, 14, 30])
+def test_rsi_matches_loop(n):
+    x = random_walk(500)
+    np.testing.assert_allclose(relative_strength_index(x, n), old_rsi(x, n), rtol=1e-10)
+
+def test_rsi_matrix_matches_columns():
+    x = random_walk(400, 5)
+    rsi = relative_strength_index(x, 14)
+    for j in range(x.shape[1]):
+        np.testing.assert_allclose(rsi[:, j], old_rsi(x[:, j], 14), rtol=1e-10)
+
+@pytest.mark.parametrize('n', [2, 12, 26, 200])
+def test_ema_matches_loop(n):
+    x = random_walk(1000)
+    np.testing.assert_allclose(moving_average(x, n, type='exponential'), old_ema(x, n), rtol=1e-10)
+
+def test_ema_matrix_and_window_list():
+    x = random_walk(300, 4)
+    out = moving_average(x, [12, 26], type='exponential')
+    assert out.shape == (2,) + x.shape
+    for k, n in enumerate([12, 26]):
+        for j in range(x.shape[1]):
+            np.testing.assert_allclose(out[k, :, j], old_ema(x[:, j], n), rtol=1e-10)
+
+@pytest.mark.parametrize('n', [1, 3, 14, 50])
+def test_rolling_extrema_match_windows(n):
+    x = random_walk(300, 3)
+    highest = rolling_max(x, n)
+    lowest = rolling_min(x, n)
+    assert np.isnan(highest[:n-1]).all() and np.isnan(lowest[:n-1]).all()
+    for i in range(n-1, len(x)):
+        np.testing.assert_array_equal(highest[i], x[i-n+1:i+1].max(axis=0))
+        np.testing.assert_array_equal(lowest[i], x[i-n+1:i+1].min(axis=0))
+
+def test_rolling_extrema_shorter_than_window():
+    assert np.isnan(rolling_max(random_walk(5), 10)).all()
+
+@pytest.mark.parametrize('nK', [5, 14])
+def test_stochastic_matches_loop(nK):
+    rng = np.random.default_rng(3)
+    close = random_walk(400)
+    high = close * (1 + np.abs(0.01 * rng.standard_normal(len(close))))
+    low = close * (1 - np.abs(0.01 * rng.standard_normal(len(close))))
+    [K, D] = stochastic_oscillator(close, high, low, nK, 3)
+    [oldK, oldD] = old_stochastic(close, high, low, nK, 3)
+    np.testing.assert_allclose(K, oldK, rtol=1e-10)
+    np.testing.assert_allclose(D, oldD, rtol=1e-10)
+
+@pytest.mark.parametrize('n', [2, 10, 50])
+def test_sma_matrix_matches_convolution(n):
+    x = random_walk(500, 6)
+    x[np.random.default_rng(4).random(x.shape) < 0.01] = np.nan
+    sma = moving_average(x, n)
+    for j in range(x.shape[1]):
+        np.testing.assert_allclose(sma[:, j], old_sma(x[:, j], n), rtol=1e-9, atol=1e-9)
+
+@pytest.mark.parametrize('length', [0, 1, 2, 3, 4, 5, 10, 30, 200])
+def test_find_trend_matches_polyfit(length):
+    rng = np.random.default_rng(length)
+    for k in range(20):
+        y = 100 + rng.normal(0, 5, length).cumsum() if k % 2 else rng.normal(0, 1, length)
+        if k % 5 == 0 and length > 0:
+            y[0] = 0
+        for fit_poly in [True, False]:
+            np.testing.assert_allclose(find_trend(y, fit_poly), old_find_trend(y, fit_poly), rtol=1e-7, atol=1e-12)
+
+def test_find_trends_skip_nan():
+    rng = np.random.default_rng(5)
+    y = 50 + rng.normal(0, 3, (60, 20)).cumsum(axis=0)
+    y[rng.random(y.shape) < 0.2] = np.nan
+    expected = [old_find_trend(y[~np.isnan(y[:, j]), j]) for j in range(y.shape[1])]
+    np.testing.assert_allclose(find_trends(y), expected, rtol=1e-7)
+
+@pytest.mark.parametrize('n', [2, 5, 10])
+@pytest.mark.parametrize('fit_poly', [True, False])
+def test_rolling_trend_matches_scan(n, fit_poly):
+    rng = np.random.default_rng(n)
+    x = 100 + rng.normal(0, 1, (400, 3)).cumsum(axis=0)
+    x[100, 1] = np.nan
+    x[200, 2] = np.inf
+    [slopes, turnaround] = rolling_trend(x, n, fit_poly)
+    for j in range(x.shape[1]):
+        for t in range(len(x)):
+            window = x[max(0, t-n+1):t+1, j]
+            if t < n-1 or not np.isfinite(window).all():
+                assert np.isnan(slopes[t, j]) and not turnaround[t, j]
+            else:
+                np.testing.assert_allclose(slopes[t, j], old_find_trend(window, fit_poly), rtol=1e-6, atol=1e-9)
@@ -0,0 +1,387 @@
+import warnings
+from stock_analysis.utils import *
+from stock_analysis.symbol import Benchmark
+
+#
+# Universe-wide computation of the stats of Symbol.get_stats().
+#
+# The quotes of all components are aligned into dates x symbols arrays once, and the return,
+# diverge and trend stats are computed as whole-array operations instead of Symbol by Symbol.
+# Every symbol still sees exactly its own (dropna'd) rows, see QuoteMatrix.apply().
+#
+
+def _day(d):
+    # datetime.date, Timestamp or str to numpy day
+    return np.datetime64(pd.Timestamp(d).date(), 'D')
+
+class QuoteMatrix(object):
+    """
+    History quotes of many symbols aligned into dates x symbols arrays.
+    """
+    def __init__(self, quotes, columns=['Adj Close', 'Close', 'High', 'Low']):
+        """
+        quotes: dict of <symbol:DataFrame> or Pandas Panel, e.g. from Index._get_chunk_quotes()
+        columns: columns to be aligned
+
+        Rows with any NaN are dropped for each symbol first, like Index._get_single_compo_stat().
+        """
+        frames = dict()
+        for sym in quotes.keys():
+            quote = quotes[sym].dropna()
+            if not quote.empty:
+                frames[sym] = quote.set_index(pd.to_datetime(quote.index))
+        self.symbols = list(frames.keys())
+        self.data = dict()
+        if len(self.symbols) == 0:
+            self.dates = pd.DatetimeIndex([])
+            for col in columns:
+                self.data[col] = np.zeros((0, 0))
+        else:
+            for col in columns:
+                # aligned on the union of all dates
+                df = pd.concat([frames[sym][col] for sym in self.symbols], axis=1, keys=self.symbols).sort_index()
+                self.data[col] = df.values.astype(float)
+            self.dates = df.index
+        self.days = self.dates.values.astype('datetime64[D]')
+        self.valid = ~np.isnan(self.data[columns[0]])
+        # first and last dates of every symbol
+        self.first_row = np.argmax(self.valid, axis=0)
+        self.last_row = len(self.dates) - 1 - np.argmax(self.valid[::-1], axis=0)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def rows(self, start, end):
+        """
+        Rows [r0, r1) of the dates between start and end, both inclusive,
+        like slicing quotes by 'YYYY-MM-DD' strings.
+        """
+        r0 = np.searchsorted(self.days, _day(start), side='left')
+        r1 = np.searchsorted(self.days, _day(end), side='right')
+        return [r0, r1]
+
+    def first_valid(self, x, r0=0, r1=None):
+        """
+        The first non-NaN value of every column of x within rows [r0, r1), NaN if none.
+        """
+        return self._valid_value(x, r0, r1, last=False)
+
+    def last_valid(self, x, r0=0, r1=None):
+        """
+        The last non-NaN value of every column of x within rows [r0, r1), NaN if none.
+        """
+        return self._valid_value(x, r0, r1, last=True)
+
+    def _valid_value(self, x, r0, r1, last):
+        sub = x[r0:r1]
+        out = np.full(x.shape[1], np.nan)
+        if len(sub) == 0:
+            return out
+        m = ~np.isnan(sub)
+        if last:
+            idx = len(sub) - 1 - np.argmax(m[::-1], axis=0)
+        else:
+            idx = np.argmax(m, axis=0)
+        found = m.any(axis=0)
+        cols = np.arange(x.shape[1])
+        out[found] = sub[idx[found], cols[found]]
+        return out
+
+    def apply(self, func, arrays, r0=0, r1=None, min_rows=1, nout=1):
+        """
+        Apply func to the valid rows of every symbol within rows [r0, r1).
+
+        func: takes one 2-D block of dates x symbols per array, returns nout arrays of the same shape
+        arrays: list of dates x symbols arrays
+        min_rows: symbols with fewer valid rows are left NaN
+        Return: an array (or a list of nout arrays) with the shape of arrays[0], NaN elsewhere.
+
+        Symbols are grouped by their span of valid rows and each group is computed in one call,
+        so func sees the same data as with the quotes of a single symbol. Symbols with gaps
+        inside the span are computed one by one on their compressed rows.
+        """
+        if r1 == None:
+            r1 = len(self.dates)
+        shape = arrays[0].shape
+        outputs = [np.full(shape, np.nan) for i in range(nout)]
+        if r1 <= r0 or shape[1] == 0:
+            return outputs[0] if nout == 1 else outputs
+        valid = np.logical_and.reduce([~np.isnan(a[r0:r1]) for a in arrays])
+        counts = valid.sum(axis=0)
+        first = np.argmax(valid, axis=0)
+        last = (r1 - r0) - 1 - np.argmax(valid[::-1], axis=0)
+        ok = counts >= max(min_rows, 1)
+        contiguous = ok & (counts == last - first + 1)
+
+        def save(res, rows, cols):
+            if nout == 1:
+                res = [res]
+            for out, r in zip(outputs, res):
+                out[rows, cols] = r
+
+        # symbols with the same span are computed together
+        keys = first * (r1 - r0 + 1) + last
+        for key in np.unique(keys[contiguous]):
+            cols = np.nonzero(contiguous & (keys == key))[0]
+            f = r0 + first[cols[0]]
+            l = r0 + last[cols[0]] + 1
+            blocks = [a[f:l][:, cols] for a in arrays]
+            save(func(*blocks), slice(f, l), cols)
+        # symbols with gaps
+        for j in np.nonzero(ok & ~contiguous)[0]:
+            rows = r0 + np.nonzero(valid[:, j])[0]
+            blocks = [a[rows, j][:, np.newaxis] for a in arrays]
+            res = func(*blocks)
+            if nout == 1:
+                save(res[:, 0], rows, j)
+            else:
+                save([r[:, 0] for r in res], rows, j)
+        return outputs[0] if nout == 1 else outputs
+
+    def ema(self, x, n, start, end):
+        """
+        EMA of every column between start and end, like Symbol.ema().
+        start: a date, or an array of dates, one per column
+        """
+        out = np.full(x.shape, np.nan)
+        starts = np.broadcast_to(np.asarray(start, dtype='datetime64[D]'), (x.shape[1],))
+        for s in np.unique(starts):
+            cols = np.nonzero(starts == s)[0]
+            # EMA is start date sensitive, the first n days are used for init
+            tmp_start = pd.Timestamp(s) - BDay(n)
+            [r0, r1] = self.rows(tmp_start, end)
+            avg = self.apply(lambda y: moving_average(y, n, type='exponential'), [x[:, cols]], r0, r1)
+            rs = self.rows(s, end)[0]
+            out[rs:r1, cols] = avg[rs:r1]
+        return out
+
+    def return_on_investment(self, start, end, cols=None):
+        """
+        Return on investment of Adj Close between start and end, excluding dividends,
+        like Symbol.return_on_investment(exclude_dividend=True).
+        """
+        adj_close = self.data['Adj Close']
+        if cols is not None:
+            adj_close = adj_close[:, cols]
+        [r0, r1] = self.rows(start, end)
+        first = self.first_valid(adj_close, r0, r1)
+        last = self.last_valid(adj_close, r0, r1)
+        roi = (last - first) / first
+        roi[np.isnan(first)] = -99999999
+        return roi
+
+    def return_periodic(self, periods=6, freq='365D'):
+        """
+        Periodic average/median returns, like Symbol.return_periodic().
+        Return: [averages, medians]
+        """
+        num = len(self.symbols)
+        avg = np.full(num, np.nan)
+        median = np.full(num, np.nan)
+        first_days = self.days[self.first_row]
+        # the periods end at the last date of each symbol
+        for last in np.unique(self.last_row):
+            cols = np.nonzero(self.last_row == last)[0]
+            days = pd.date_range(end=self.dates[last].date(), periods=periods, freq=freq)[::-1]
+            returns = np.full((len(days)-1, len(cols)), np.nan)
+            for i in range(1, len(days)):
+                # out of boundary for the symbols starting later
+                inside = _day(days[i]) >= first_days[cols]
+                if not inside.any():
+                    break
+                roi = self.return_on_investment(days[i], days[i-1], cols)
+                returns[i-1] = np.where(inside, roi, np.nan)
+            # only the periods before the first one out of boundary
+            returns[np.isnan(np.cumsum(returns, axis=0))] = np.nan
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                avg[cols] = np.nanmean(returns, axis=0)
+                median[cols] = np.nanmedian(returns, axis=0)
+        for sym in np.array(self.symbols)[np.isnan(avg)]:
+            print('Error: %s: failed to calculate periodic(%s) returns.' %(sym, freq))
+        return [avg, median]
+
+    def return_stats(self, end=None):
+        """
+        Stats of return for all symbols, like Symbol.return_stats(exclude_dividend=True).
+        """
+        labels = ['Symbol', 'LastQuarterReturn', 'HalfYearReturn', '1YearReturn', '2YearReturn', '3YearReturn', 'AvgQuarterlyReturn', 'MedianQuarterlyReturn', 'AvgYearlyReturn', 'MedianYearlyReturn', 'PriceIn52weekRange']
+        [end_date, three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago, five_year_ago] = get_stats_intervals(parse_start_end_date(None, end)[1])
+
+        quarter_return = self.return_on_investment(three_month_ago, end_date)
+        half_year_return = self.return_on_investment(half_year_ago, end_date)
+        one_year_return = self.return_on_investment(one_year_ago, end_date)
+        two_year_return = self.return_on_investment(two_year_ago, end_date)
+        three_year_return = self.return_on_investment(three_year_ago, end_date)
+
+        [yearly_ret_avg, yearly_ret_median] = self.return_periodic(periods=6, freq='365D') # yearly returns in the past 5 years
+        [quart_ret_avg, quarty_ret_median] = self.return_periodic(periods=13, freq='90D') # quarterly returns in the past 3 years
+
+        # Current price in 52-week range should between [0, 1] - larger number means more expensive.
+        adj_close = self.data['Adj Close']
+        [r0, r1] = self.rows(one_year_ago, end_date)
+        current = self.last_valid(adj_close, r0, r1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            low = np.nanmin(adj_close[r0:r1], axis=0) if r1 > r0 else current
+            high = np.nanmax(adj_close[r0:r1], axis=0) if r1 > r0 else current
+            pos_in_range = (current - low) / (high - low)
+        pos_in_range[np.isnan(current)] = 0
+
+        stats = DataFrame({'Symbol': self.symbols}, columns=labels)
+        for label, values in zip(labels[1:], [quarter_return, half_year_return, one_year_return, two_year_return, three_year_return, quart_ret_avg, quarty_ret_median, yearly_ret_avg, yearly_ret_median, pos_in_range]):
+            stats[label] = values
+        return stats.set_index('Symbol')
+
+    def diverge_to_index(self, index, n=10, start=None, end=None):
+        """
+        Mean divergence of every symbol to the index, like Symbol.diverge_to_index(...).mean().
+
+        index: Symbol of index with quotes, or its shared Benchmark
+        Return: [means, empty], where empty flags the symbols without divergence data.
+        """
+        if not isinstance(index, Benchmark):
+            index = Benchmark(index)
+        num = len(self.symbols)
+        means = np.full(num, np.nan)
+        empty = np.ones(num, dtype=bool)
+        if index.quotes.empty or num == 0:
+            return [means, empty]
+        [start_date, end_date] = parse_start_end_date(start, end)
+        # use the latest available starting date
+        index_first = _day(index.quotes.first_valid_index())
+        starts = np.maximum(np.maximum(self.days[self.first_row], index_first), _day(start_date))
+        adj_close = self.data['Adj Close']
+        move_avg_symbol = self.ema(adj_close, n, starts, end_date)
+        for s in np.unique(starts):
+            cols = np.nonzero(starts == s)[0]
+            move_avg_index = index.normalized_ema(n, pd.Timestamp(s).date(), end_date)
+            if move_avg_index.empty:
+                continue
+            [r0, r1] = self.rows(s, end_date)
+            symbol_first = self.first_valid(move_avg_symbol[:, cols], r0, r1)
+            has_data = ~np.isnan(symbol_first)
+            index_norm = pd.Series(move_avg_index.values, index=pd.to_datetime(move_avg_index.index)).reindex(self.dates[r0:r1]).values
+            diff = move_avg_symbol[r0:r1, cols] / symbol_first - index_norm[:, np.newaxis]
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                means[cols] = np.where(has_data, np.nanmean(diff, axis=0), np.nan)
+            empty[cols] = ~has_data
+        return [means, empty]
+
+    def diverge_stats(self, index, end=None):
+        """
+        Stats of divergence to the index, like Symbol.diverge_stats().
+        index: Symbol of index with quotes, or its shared Benchmark
+        """
+        if not isinstance(index, Benchmark):
+            index = Benchmark(index) # shared by all the windows below
+        labels = ['Symbol', 'HalfYearDivergeIndex', '1YearDivergeIndex', '2YearDivergeIndex', '3YearDivergeIndex', 'YearlyDivergeIndex']
+        [end_date, three_month_ago, half_year_ago, one_year_ago, two_year_ago, three_year_ago, five_year_ago] = get_stats_intervals(parse_start_end_date(None, end)[1])
+        half_year_diverge = self.diverge_to_index(index, start=half_year_ago, end=end_date)[0]
+        one_year_diverge = self.diverge_to_index(index, start=one_year_ago, end=end_date)[0]
+        two_year_diverge = self.diverge_to_index(index, start=two_year_ago, end=end_date)[0]
+        three_year_diverge = self.diverge_to_index(index, start=three_year_ago, end=end_date)[0]
+
+        # yearly divergence, the loop of Symbol.diverge_stats() for all symbols at once
+        num = len(self.symbols)
+        yearly_diverge = np.zeros(num)
+        count = np.zeros(num)
+        active = np.ones(num, dtype=bool)
+        if not index.quotes.empty:
+            start_date = np.maximum(self.days[self.first_row], _day(index.quotes.first_valid_index()))
+            days = pd.date_range(end=end_date, periods=6, freq='365D')[::-1] # The past 5 years in reverse order
+            for i in range(1, len(days)):
+                count[active] = i
+                active &= ~(_day(days[i]) < start_date) # out of boundary
+                if not active.any():
+                    break
+                [diff, empty] = self.diverge_to_index(index, start=days[i], end=days[i-1])
+                active &= ~empty
+                yearly_diverge[active] += diff[active]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            yearly_diverge /= count
+
+        stats = DataFrame({'Symbol': self.symbols}, columns=labels)
+        for label, values in zip(labels[1:], [half_year_diverge, one_year_diverge, two_year_diverge, three_year_diverge, yearly_diverge]):
+            stats[label] = values
+        return stats.set_index('Symbol')
+
+    def trend_stats(self):
+        """
+        Technical details of trend for all symbols, like Symbol.trend_stats().
+        """
+        end_date = dt.date.today()
+        start_date = end_date - dt.timedelta(days=90)
+        one_month_ago = end_date - dt.timedelta(days=30)
+        labels = ['Symbol', 'ROC', 'ROC Trend 7D', 'ROC Trend 14D', 'RSI', 'MACD Diff', 'FSTO', 'SSTO', 'AvgFSTOLastMonth', 'AvgFSTOLastQuarter']
+        adj_close = self.data['Adj Close']
+        [r0, r1] = self.rows(start_date, end_date)
+
+        roc = self.apply(lambda x: rate_of_change(x, 10), [adj_close])
+        roc_stat = self.last_valid(roc, r0, r1)
+
+        # RSI is start date sensitive
+        [rsi_r0, rsi_r1] = self.rows(start_date - BDay(14), end_date)
+        rsi = self.apply(lambda x: relative_strength_index(x, 14), [adj_close], rsi_r0, rsi_r1)
+        rsi_stat = self.last_valid(rsi, r0, r1)
+
+        # MACD(12,26,9) over the full history
+        [macd_start, macd_end] = parse_start_end_date(None, None)
+        macdline = self.ema(adj_close, 12, macd_start, macd_end) - self.ema(adj_close, 26, macd_start, macd_end)
+        signal = self.apply(lambda x: moving_average(x, n=9, type='exponential'), [macdline])
+        macd_stat = self.last_valid(macdline - signal, r0, r1)
+
+        close = self.data['Close']
+        ratio = adj_close / close
+        high = self.data['High'] * ratio # adjusted high
+        low = self.data['Low'] * ratio   # adjusted low
+        [K, D] = self.apply(lambda c, h, l: stochastic_oscillator(c, h, l, 14, 3), [adj_close, high, low], min_rows=15, nout=2)
+        fsto_stat = self.last_valid(K, r0, r1)
+        ssto_stat = self.last_valid(D, r0, r1)
+        [m0, m1] = self.rows(one_month_ago, end_date)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            avg_fsto_past_month = np.nanmean(K[m0:m1], axis=0) if m1 > m0 else np.full(len(self), np.nan)
+            avg_fsto_past_quarter = np.nanmean(K[r0:r1], axis=0) if r1 > r0 else np.full(len(self), np.nan)
+
+        # ROC Trend
+        seven_days_ago = end_date - dt.timedelta(days=7)
+        forteen_days_ago = end_date - dt.timedelta(days=14)
+        roc_trend_7d = self._trend(roc, *self.rows(seven_days_ago, end_date))
+        roc_trend_14d = self._trend(roc, *self.rows(forteen_days_ago, end_date))
+
+        stats = DataFrame({'Symbol': self.symbols}, columns=labels)
+        for label, values in zip(labels[1:], [roc_stat, roc_trend_7d, roc_trend_14d, rsi_stat, macd_stat, fsto_stat, ssto_stat, avg_fsto_past_month, avg_fsto_past_quarter]):
+            stats[label] = values
+        return stats.set_index('Symbol')
+
+    def _trend(self, x, r0, r1):
+        # find_trend() of the non-NaN values of every column within rows [r0, r1)
+        return find_trends(x[r0:r1])
+
+    def roc_trends(self, n=5, fit_poly=True):
+        """
+        Trend of the 10-day ROC of every symbol at every date, see rolling_trend().
+        n: window in rows, e.g. 5 or 10 for about the 7 or 14 days of 'ROC Trend 7D' and 'ROC Trend 14D'
+        Return: [slopes, turnaround] as DataFrames of dates x symbols.
+        """
+        roc = self.apply(lambda x: rate_of_change(x, 10), [self.data['Adj Close']])
+        [slopes, turnaround] = self.apply(lambda x: rolling_trend(x, n, fit_poly), [roc], nout=2)
+        return [DataFrame(slopes, index=self.dates, columns=self.symbols),
+                DataFrame(turnaround == 1, index=self.dates, columns=self.symbols)]
+
+    def additional_stats(self, stats):
+        """
+        Additional stats for all symbols, like Symbol.additional_stats().
+        stats: Yahoo Finance stats of the symbols
+        """
+        labels = ['Symbol', 'EPSGrowth', 'Forward P/E']
+        eps_next = stats['EPSEstimateNextYear'].reindex(self.symbols).values.astype(float)
+        eps_current = stats['EPSEstimateCurrentYear'].reindex(self.symbols).values.astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eps_growth = (eps_next - eps_current) / eps_current * 100 # percent
+            # Forward P/E = (current price / EPS estimate next year)
+            forward_pe = self.last_valid(self.data['Adj Close']) / eps_next
+        stat = DataFrame({'Symbol': self.symbols, 'EPSGrowth': eps_growth, 'Forward P/E': forward_pe}, columns=labels)
+        return stat.set_index('Symbol')
@@ -5,19 +5,22 @@ import numpy as np
 import datetime as dt
 import time
 
-#conda install -c https://conda.anaconda.org/anaconda pandas-datareader
-import pandas_datareader.data as web
-import pandas_datareader as pdr
 from pandas import DataFrame
 from pandas.tseries.offsets import BDay # business days
-from pandas_datareader._utils import RemoteDataError
 from pandas.io.common import urlopen
-from bs4 import BeautifulSoup
 
-from yahoo_finance import Share
+# Remote data, scraping and plotting modules are imported on first use, see LazyModule
+from stock_analysis.lazy import LazyModule
+
+#conda install -c https://conda.anaconda.org/anaconda pandas-datareader
+web = LazyModule('pandas_datareader.data')
+pdr = LazyModule('pandas_datareader')
+pdr_utils = LazyModule('pandas_datareader._utils') # pdr_utils.RemoteDataError
+bs4 = LazyModule('bs4')
+yahoo_finance = LazyModule('yahoo_finance')
 
 # matplotlib
-import matplotlib.pyplot as plt
+plt = LazyModule('matplotlib.pyplot')
 
 # Exchange symbols:
 #   NMS = NasdaqGS; NGM = NasdagGM; NCM = NasdaqCM; ASE = AMEX; NYQ = NYSE;
@@ -119,6 +122,35 @@ def str2num(s, m2b=False):
     num = s.replace(',','').replace('-','').replace('+','').replace('%','').replace('M','').replace('B','')
     return float(num)*factor
 
+def str2nums(x, m2b=False):
+    """
+    Vectorized str2num() for a whole Series or DataFrame.
+
+    x: Pandas Series or DataFrame of strings and/or numbers
+    m2b: convert Million('M') to Billion('B')
+    Return: Series or DataFrame of floats. Unlike str2num(), unparsable strings become NaN.
+    """
+    if type(x) == DataFrame:
+        return x.apply(lambda col: str2nums(col, m2b))
+    x = pd.Series(x)
+    if pd.api.types.is_numeric_dtype(x.dtype):
+        return x.astype(float)
+    is_str = (x.map(type) == str).values
+    s = x.where(is_str, '').astype(str).str.upper()
+    first = s.str[:1]
+    last = s.str[-1:]
+    factor = np.where(first == '-', -1.0, 1.0)
+    factor = np.where(last == '%', factor/100, factor)
+    if m2b:
+        factor = np.where(last == 'M', factor/1000, factor) # million to billion
+    else:
+        factor = np.where(last == 'B', factor*1000, factor) # billion to million
+    num = pd.to_numeric(s.str.replace(r'[,\-+%MB]', '', regex=True), errors='coerce') * factor
+    num[s.isin(['', '-', 'N/A', 'NA'])] = np.nan
+    # numbers are kept as they are, anything else becomes NaN
+    num[~is_str] = pd.to_numeric(x[~is_str], errors='coerce')
+    return num.astype(float)
+
 def min_max_norm(x):
     """
     Min-Max normalization.
@@ -219,7 +251,7 @@ def get_symbol_yahoo_stats_yql(symbols, exclude_name=False):
             'Dividend/Share', 'DividendYield', 'DividendPayDate', 'ExDividendDate']
     lines = []
     for sym in sym_list:
-        stock = Share(sym)
+        stock = yahoo_finance.Share(sym)
         line = [sym]
         if not exclude_name:
             line += [stock.get_name()]
@@ -248,32 +280,254 @@ def moving_average(x, n=10, type='simple'):
     Calculate simple/exponential moving average.
 
     Inputs:
-        x - list, Numpy array, Pandas Series
-        n - window of the moving average
+        x - list, Numpy array, Pandas Series, or 2-D Numpy array with one series per column
+        n - window of the moving average, or a list of windows
         type - 'simple' or 'exponential'
     Return: pandas Series with the same length as input x.
+            For a list of windows, the results are stacked along a new first axis.
 
     Exponential Moving Average(EMA), calculated by
         SMA: 10 period sum / 10 
         Multiplier: (2 / (Time periods + 1) ) = (2 / (10 + 1) ) = 0.1818 (18.18%)
         EMA: {Close - EMA(previous day)} x multiplier + EMA(previous day).
+    The EMA recursion is evaluated by linear_filter() for all columns at once.
     """
+    if not np.isscalar(n):
+        return np.stack([moving_average(x, k, type) for k in n])
     x = np.asarray(x)
     if type == 'simple':
         # SMA
-        w = np.ones(n)
-        w /= w.sum() # weights
-        avg = np.convolve(x, w, mode='full')[:len(x)]
+        if x.ndim > 1:
+            avg = _window_sums(x, n) / n # all columns at once
+        else:
+            w = np.ones(n)
+            w /= w.sum() # weights
+            avg = np.convolve(x, w, mode='full')[:len(x)]
         avg[:n] = avg[n]
     else:
         # EMA
-        avg = np.zeros_like(x)
-        avg[:n] = x[:n].mean() # initialization
+        x = x.astype(float)
+        avg = np.empty_like(x)
+        avg[:n] = x[:n].mean(axis=0) # initialization
         m = 2/(n+1) # multiplier
-        for i in np.arange(n,len(x)):
-            avg[i] = (x[i] - avg[i-1]) * m + avg[i-1]
+        if len(x) > n:
+            # avg[i] = (x[i] - avg[i-1]) * m + avg[i-1] = (1 - m) * avg[i-1] + m * x[i]
+            avg[n:] = linear_filter(m * x[n:], 1 - m, avg[n-1])
     return avg
 
+def _window_sums(x, n):
+    """
+    Sums of the last n values along the first axis by cumulative sums, like
+    np.convolve(x, np.ones(n))[:len(x)] on each column: the first n-1 sums are of the
+    values so far, and a window containing NaN gives NaN.
+    """
+    x = np.asarray(x, dtype=float)
+    nan = np.isnan(x)
+    csum = np.zeros((len(x)+1,) + x.shape[1:])
+    csum[1:] = np.cumsum(np.where(nan, 0, x), axis=0)
+    nan_count = np.zeros((len(x)+1,) + x.shape[1:])
+    nan_count[1:] = np.cumsum(nan, axis=0)
+    start = np.maximum(np.arange(1, len(x)+1) - n, 0) # window of i is [start[i], i]
+    sums = csum[1:] - csum[start]
+    sums[(nan_count[1:] - nan_count[start]) > 0] = np.nan
+    return sums
+
+def linear_filter(x, a, init):
+    """
+    Evaluate the first-order recursion y[i] = a * y[i-1] + x[i] along the first axis.
+
+    Inputs:
+        x - Numpy array, 1-D or 2-D (rows are time, columns are series)
+        a - decay factor in [0, 1), scalar or one value per column
+        init - y[-1], scalar or one value per column
+    Return: Numpy array with the same shape as x.
+
+    The closed form y[i] = a^(i+1) * init + sum(a^(i-j) * x[j]) is evaluated with cumsum() in blocks
+    short enough that a^-k stays small, so the result matches the plain loop up to rounding.
+    """
+    x = np.asarray(x, dtype=float)
+    one_dim = (x.ndim == 1)
+    if one_dim:
+        x = x[:, np.newaxis]
+    a = np.broadcast_to(np.asarray(a, dtype=float), x.shape[1:])
+    y_prev = np.broadcast_to(np.asarray(init, dtype=float), x.shape[1:]).copy()
+    y = np.empty_like(x)
+    if a.min() <= 0:
+        # no memory, y[i] = x[i] for these columns
+        block = 1
+    else:
+        block = max(1, int(np.log(1e3) / -np.log(a.min()))) # a^-block <= 1000
+    for i in range(0, len(x), block):
+        xb = x[i:i+block]
+        p = a ** np.arange(1, len(xb)+1)[:, np.newaxis] # a^1 ... a^k
+        if block == 1:
+            yb = p * y_prev + xb
+        else:
+            yb = p * (y_prev + np.cumsum(xb / p, axis=0))
+        y[i:i+block] = yb
+        y_prev = yb[-1]
+    if one_dim:
+        y = y[:, 0]
+    return y
+
+def relative_strength_index(x, n=14):
+    """
+    Calculate Relative Strength Index(RSI) with Wilder's smoothing.
+
+    Inputs:
+        x - prices, 1-D array-like or 2-D Numpy array of dates x symbols
+        n - window of the RSI
+    Return: Numpy array with the same shape as x.
+
+    RSI = 100 - 100 / (1 + Average Gain / Average Loss), see wilder_averages().
+    """
+    [up, down] = wilder_averages(x, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100. - 100./(1. + up/down)
+    return rsi
+
+def wilder_averages(x, n=14):
+    """
+    Calculate the average gains and losses of RSI at every position.
+
+    Inputs:
+        x - prices, 1-D array-like or 2-D Numpy array of dates x symbols
+        n - window of the RSI
+    Return: [average gains, average losses], Numpy arrays with the same shape as x.
+
+    The first n values are seeded with the simple averages of the first n+1 price changes,
+    and the following ones are smoothed by
+        Average Gain = [(previous Average Gain) x (n-1) + current Gain] / n
+    which is a recursive filter with decay (n-1)/n, see linear_filter().
+    """
+    x = np.asarray(x, dtype=float)
+    m = np.diff(x, axis=0)
+
+    # initialization
+    seed = m[:n+1] # cause the diff is 1 shorter
+    up = np.where(seed >= 0, seed, 0).sum(axis=0) / n
+    down = -np.where(seed < 0, seed, 0).sum(axis=0) / n # losses should be positive
+    ups = np.empty_like(x)
+    downs = np.empty_like(x)
+    ups[:n] = up
+    downs[:n] = down
+
+    # subsequent calculations
+    if len(x) > n:
+        d = m[n-1:]
+        gain = np.where(d > 0, d, 0)
+        loss = np.where(d > 0, 0, -d) # losses should be positive
+        a = (n - 1) / n
+        ups[n:] = linear_filter(gain / n, a, up)
+        downs[n:] = linear_filter(loss / n, a, down)
+    return [ups, downs]
+
+def rolling_max(x, n):
+    """
+    Calculate the maximum of the last n values at every position, in O(len(x)).
+
+    Inputs:
+        x - 1-D array-like or 2-D Numpy array, windows slide along the first axis
+        n - window length
+    Return: Numpy array with the same shape as x, the first n-1 values are NaN.
+
+    The van Herk/Gil-Werman algorithm is used: x is split into blocks of n values,
+    and a window always spans the suffix of one block and the prefix of the next.
+    """
+    return _rolling_extrema(x, n, np.maximum, -np.inf)
+
+def rolling_min(x, n):
+    """
+    Calculate the minimum of the last n values at every position, in O(len(x)).
+    See rolling_max().
+    """
+    return _rolling_extrema(x, n, np.minimum, np.inf)
+
+def _rolling_extrema(x, n, func, fill):
+    x = np.asarray(x, dtype=float)
+    length = len(x)
+    out = np.full(x.shape, np.nan)
+    if n < 1 or length < n:
+        return out
+    num_blocks = int(np.ceil(length / n))
+    padded = np.full((num_blocks * n,) + x.shape[1:], fill)
+    padded[:length] = x
+    blocks = padded.reshape((num_blocks, n) + x.shape[1:])
+    prefix = func.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    out[n-1:] = func(suffix[:length-n+1], prefix[n-1:length])
+    return out
+
+def stochastic_oscillator(close, high, low, nK=14, nD=3):
+    """
+    Calculate the stochastic oscillator.
+
+    Inputs:
+        close, high, low - prices, 1-D array-likes or 2-D Numpy arrays of dates x symbols
+        nK - window of fast stochastic oscillator %K
+        nD - window of slow stochastic oscillator %D
+    Return: [%K, %D] as Numpy arrays with the same shape as close.
+
+    %K = (Close Price - Lowest Low) / (Highest High - Lowest Low) * 100 over the last nK periods,
+    and the first nK-1 values are filled with the first complete one. %D is the nD-period SMA of %K.
+    """
+    close = np.asarray(close, dtype=float)
+    if len(close) < nK:
+        return [np.full(close.shape, np.nan), np.full(close.shape, np.nan)]
+    lowest = rolling_min(low, nK)
+    highest = rolling_max(high, nK)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        K = (close - lowest) / (highest - lowest) * 100
+    K[:nK-1] = K[nK-1]
+    D = moving_average(K, n=nD, type='simple')
+    return [K, D]
+
+def momentum(x, n=2):
+    """
+    Calculate momentum, the price difference over a window of n periods:
+        Momentum = x[i] - x[i-n+1]
+
+    Inputs:
+        x - 1-D array-like or 2-D Numpy array of dates x symbols
+        n - window length, or a list of window lengths
+    Return: Numpy array with the same shape as x, the first n-1 values are NaN.
+            For a list of windows, the results are stacked along a new first axis.
+    """
+    return _lagged_change(x, n, lambda cur, prev: cur - prev)
+
+def rate_of_change(x, n=10):
+    """
+    Calculate Rate of Change(ROC) over a window of n periods:
+        ROC = (x[i] / x[i-n+1] - 1) * 100
+    See momentum() for inputs and return.
+    """
+    return _lagged_change(x, n, lambda cur, prev: (cur / prev - 1) * 100)
+
+def _lagged_change(x, windows, calc):
+    """
+    Apply calc(x[i], x[i-n+1]) for every window length n in a single pass over x.
+    Like pandas rolling(n), a window containing any NaN gives NaN.
+    """
+    x = np.asarray(x, dtype=float)
+    single = np.isscalar(windows)
+    if single:
+        windows = [windows]
+    # number of NaNs before each position, to find windows containing NaN
+    nan_count = np.zeros((len(x)+1,) + x.shape[1:])
+    nan_count[1:] = np.cumsum(np.isnan(x), axis=0)
+    out = np.full((len(windows),) + x.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k, n in enumerate(windows):
+            lag = n - 1
+            if lag < 0 or len(x) <= lag:
+                continue
+            change = calc(x[lag:], x[:len(x)-lag])
+            has_nan = (nan_count[n:] - nan_count[:len(x)-lag]) > 0
+            out[k, lag:] = np.where(has_nan, np.nan, change)
+    if single:
+        return out[0]
+    return out
+
 def find_trend(y, fit_poly=True):
     """
     Find the trend of input data.
@@ -285,8 +539,6 @@ def find_trend(y, fit_poly=True):
     """
     if len(y) < 2:
         return 0
-    if np.inf in list(y):
-        return np.nan
 
     counts = len(y)
     if type(y) == pd.Series:
@@ -298,30 +550,139 @@ def find_trend(y, fit_poly=True):
             counts = y.last_valid_index() - y.first_valid_index()
             counts = counts.days
 
-    x = np.linspace(0, counts, len(y))
-    yy = np.array(y, copy=True) # make a copy to avoid changing input data
-    if yy[0] == 0:
-        yy[0] += 0.0000001
-    yy /= yy[0] # normalization
-    if len(yy) < 4:
-        fit_poly = False
+    return find_trends(np.asarray(y, dtype=float), fit_poly=fit_poly, spans=counts)
+
+def _masked_slopes(x, y, mask):
+    # least-squares slopes of the columns of y over x, only the rows in mask
+    n = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xm = np.where(mask, x, 0).sum(axis=0) / n
+        dx = np.where(mask, x - xm, 0)
+        return (dx * y).sum(axis=0) / (dx * dx).sum(axis=0)
+
+def find_trends(y, fit_poly=True, spans=None):
+    """
+    Find the trends of many series at once, same as find_trend() of the non-NaN values of each.
+
+    The slopes are computed in closed form from sums over the columns, instead of np.polyfit()
+    per series.
+
+    Inputs:
+        y: 1-D array, 2-D array of series in columns, or DataFrame. NaN values are skipped.
+        fit_poly: True to return 0 for turnaround, i.e. the slopes of the first and second half
+                  have opposite signs.
+        spans: x range of each series, default to the number of values, or the days between the
+               first and last valid dates for a DataFrame indexed by date strings.
+    Return: slopes or 0 for turnaround, a scalar for 1-D input or a Series for DataFrame.
+    """
+    columns = None
+    if type(y) == DataFrame:
+        columns = y.columns
+        if spans is None and len(y) > 0 and type(y.index[0]) == str:
+            spans = np.array([(pd.to_datetime(y[c].last_valid_index()) - pd.to_datetime(y[c].first_valid_index())).days if y[c].notnull().any() else 0
+                              for c in columns], dtype=float)
+    yy = np.array(y, dtype=float) # make a copy to avoid changing input data
+    one_d = yy.ndim == 1
+    if one_d:
+        yy = yy.reshape(-1, 1)
+    if yy.shape[0] == 0:
+        yy = np.full((1, yy.shape[1]), np.nan)
+    cols = np.arange(yy.shape[1])
+
+    mask = ~np.isnan(yy)
+    counts = mask.sum(axis=0)
+    pos = np.cumsum(mask, axis=0) - 1 # position among the valid values
+    has_inf = np.isinf(yy).any(axis=0)
+
+    # normalization by the first valid value
+    first = np.argmax(mask, axis=0)
+    zero = yy[first, cols] == 0
+    yy[first[zero], cols[zero]] = 0.0000001
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yy /= yy[first, cols]
+    yy[~mask] = 0
+
+    slopes = _masked_slopes(pos, yy, mask)
+    if spans is None:
+        spans = counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = slopes * (counts - 1) / spans # x is evenly spaced in [0, span]
 
     if fit_poly:
-        # line-fitting the first and second half data - if the slopes are both positive or negative,
-        # then these data can be fitted by a line. Otherwise, this is a turn over.
-        mid = int(len(yy)/2)
-        y1 = yy[:mid]
-        y2 = yy[mid:]
-        x1 = np.arange(len(y1))
-        x2 = np.arange(len(y2))
-        p1 = np.polyfit(x1, y1, 1)
-        p2 = np.polyfit(x2, y2, 1)
-        if (p1[0] > 0 and p2[0] < 0) or (p1[0] < 0 and p2[0] > 0):
-            return 0 # turnaround
-
-    # these data can only be fitted by a line
-    p = np.polyfit(x,yy,1)
-    return p[0]
+        # line-fitting the first and second half data, turnaround if the slopes have opposite signs
+        mid = counts // 2
+        p1 = _masked_slopes(pos, yy, mask & (pos < mid))
+        p2 = _masked_slopes(pos, yy, mask & (pos >= mid))
+        turn = (counts >= 4) & (((p1 > 0) & (p2 < 0)) | ((p1 < 0) & (p2 > 0)))
+        slopes[turn] = 0
+    slopes[has_inf] = np.nan
+    slopes[counts < 2] = 0
+
+    if one_d:
+        return slopes[0]
+    if columns is not None:
+        return pd.Series(slopes, index=columns)
+    return slopes
+
+def _rolling_slopes(z, n):
+    # least-squares slopes over x = 0..n-1 of every n consecutive rows of z, by the window
+    # sums of z and i*z from cumulative sums, the first n-1 rows are NaN
+    out = np.full(z.shape, np.nan)
+    if len(z) < n:
+        return out
+    i = np.arange(len(z), dtype=float).reshape((-1,) + (1,) * (z.ndim - 1))
+    zeros = np.zeros((1,) + z.shape[1:])
+    cz = np.concatenate([zeros, np.cumsum(z, axis=0)])
+    ciz = np.concatenate([zeros, np.cumsum(i * z, axis=0)])
+    sy = cz[n:] - cz[:-n]
+    sxy = ciz[n:] - ciz[:-n] - i[:len(sy)] * sy # x relative to the window start
+    sx = n * (n - 1) / 2
+    sxx = (n - 1) * n * (2 * n - 1) / 6
+    out[n-1:] = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    return out
+
+def rolling_trend(x, n, fit_poly=True):
+    """
+    Calculate the trend of the last n values at every position, in O(len(x)).
+
+    Inputs:
+        x - 1-D array-like or 2-D Numpy array, windows slide along the first axis
+        n - window length, in rows, e.g. 5 or 10 for about 7 or 14 calendar days of quotes
+        fit_poly - True to detect turnarounds, see find_trend()
+    Return: [slopes, turnaround] as Numpy arrays with the same shape as x. A slope is
+    find_trend() of the window, 0 for turnaround. The first n-1 values and the windows with
+    NaN or inf are NaN, and not turnarounds.
+    """
+    x = np.asarray(x, dtype=float)
+    slopes = np.full(x.shape, np.nan)
+    turnaround = np.zeros(x.shape, dtype=bool)
+    if len(x) < max(n, 2):
+        if n < 2:
+            slopes[np.isfinite(x)] = 0
+        return [slopes, turnaround]
+    bad = ~np.isfinite(x)
+    nbad = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(bad, axis=0)])
+    nbad = nbad[n:] - nbad[:-n] # bad values in every window
+    # shifted by the first value of the column to keep the sums small, the slopes are the same
+    z = np.where(bad, 0, x - np.where(np.isfinite(x[0]), x[0], 0))
+
+    # slopes of the values normalized by the first value of the window
+    first = x[:len(x)-n+1].copy()
+    first[first == 0] = 0.0000001
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes[n-1:] = _rolling_slopes(z, n)[n-1:] / first * (n - 1) / n # x is evenly spaced in [0, n]
+
+    if fit_poly and n >= 4:
+        # line-fitting the first and second half of every window
+        mid = n // 2
+        p1 = np.full(x.shape, np.nan)
+        p1[n-mid:] = _rolling_slopes(z, mid)[:len(x)-n+mid]
+        p2 = _rolling_slopes(z, n - mid)
+        turnaround = ((p1 > 0) & (p2 < 0)) | ((p1 < 0) & (p2 > 0))
+        slopes[turnaround] = 0
+    slopes[n-1:][nbad > 0] = np.nan
+    turnaround[n-1:][nbad > 0] = False
+    return [slopes, turnaround]
 
 
 # 